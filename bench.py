@@ -0,0 +1,329 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HEAVY_MODULES = ('numpy', 'matplotlib', 'openpyxl', 'prettytable')
+RESULTS_FILE = "bench_results.json"
+DATA_DIR = os.path.join(tempfile.gettempdir(), "task2_bench")
+SIZES = (10 ** 4, 10 ** 5)
+VACANCY_ROWS = 10 ** 5
+PRINT_ROWS = 1000
+REGRESSION = 1.1
+REGRESSION_METRICS = dict(seconds=("с", False), ms=("мс", False), mb_per_s=("МБ/с", True))
+REPEAT = 3
+STATS_HEADER = ['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at']
+VACANCY_HEADER = ['name', 'description', 'key_skills', 'experience_id', 'premium', 'employer_name', 'salary_from',
+                  'salary_to', 'salary_gross', 'salary_currency', 'area_name', 'published_at']
+CURRENCIES = dict(RUR=880, USD=40, KZT=30, EUR=15, UAH=15, BYR=10, AZN=3, GEL=3, KGS=2, UZS=2)
+CITIES = dict([("Москва", 350), ("Санкт-Петербург", 150), ("Новосибирск", 30), ("Екатеринбург", 30), ("Казань", 25),
+               ("Нижний Новгород", 20), ("Краснодар", 20), ("Самара", 15), ("Ростов-на-Дону", 15), ("Минск", 15),
+               ("Алматы", 15), ("Пермь", 10), ("Воронеж", 10), ("Уфа", 10), ("Омск", 10), ("Томск", 8),
+               ("Челябинск", 8), ("Тюмень", 8), ("Ярославль", 5), ("Киров", 5)] +
+              [(f"Город {i}", 250 / (i + 10)) for i in range(300)])
+YEARS = {x: x - 2000 for x in range(2005, 2023)}
+PROFESSIONS = ["Программист", "Python разработчик", "Java developer", "Аналитик", "Системный администратор",
+               "Тестировщик", "Frontend-разработчик", "Менеджер проекта", "Дизайнер", "DevOps инженер"]
+LEVELS = ["", "Junior ", "Middle ", "Senior ", "Ведущий "]
+SKILLS = ["Python", "SQL", "Git", "Linux", "Java", "Docker", "JavaScript", "1С", "Excel", "Английский язык"]
+EXPERIENCE = ["noExperience", "between1And3", "between3And6", "moreThan6"]
+DESCRIPTION = "<p><strong>Обязанности:</strong></p>\n  <ul>\n<li>Разработка   сервисов на Python;</li>\n" \
+              "<li>Поддержка <em>legacy</em> кода</li></ul>\n\n<p>Мы предлагаем: ДМС, офис   в центре.</p>\n"
+
+
+def bench_startup(module="task2", repeat=10):
+    """ Замеряет время холодного запуска интерпретатора с импортом модуля
+
+    Из времени вычитается запуск пустого интерпретатора, чтобы осталась только стоимость импорта
+
+    :param module: Имя модуля
+    :param repeat: Кол-во запусков
+    :return: dict Медиана времени импорта в мс и тяжёлые модули, загруженные при импорте
+    """
+    def run(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            times.append(time.perf_counter() - start)
+        return statistics.median(times) * 1000, result.stdout
+
+    empty, _ = run("pass")
+    full, loaded = run(f"import sys, {module}; print(*[x for x in {HEAVY_MODULES!r} if x in sys.modules])")
+    return dict(stage=f"startup {module}", ms=round(full - empty, 1), heavy_modules=loaded.split())
+
+
+def _reference_clean(field):
+    """ Очистка поля так, как её делал csv_filter до движка очистки
+
+    :param field: Строка
+    :return: str Очищенная строка
+    """
+    field = re.sub(r"<[^>]+>", "", field, flags=re.S)
+    return re.sub(r'\s+', " ", ', '.join([f.strip() for f in field.split("\n")]))
+
+
+def bench_clean(rows=2000, repeat=20):
+    """ Замеряет пропускную способность очистки полей на данных с длинными описаниями
+
+    :param rows: Кол-во описаний
+    :param repeat: Во сколько раз повторить шаблон описания в одном поле
+    :return: list(dict) МБ/с для старой очистки, clean_field и clean_field с ограничением длины
+    """
+    from wtf import clean_field, TRIM
+
+    fields = [DESCRIPTION * repeat + str(i) for i in range(rows)]
+    size = sum(len(x.encode()) for x in fields) / 1024 / 1024
+    results = []
+    for stage, clean in (("clean reference", _reference_clean), ("clean_field", clean_field),
+                         ("clean_field limit", lambda x: clean_field(x, TRIM))):
+        start = time.perf_counter()
+        for field in fields:
+            clean(field)
+        results.append(dict(stage=stage, mb_per_s=round(size / (time.perf_counter() - start), 1)))
+    return results
+
+
+def generate_csv(file_name, rows, seed=0, vacancies=False):
+    """ Создаёт csv файл с синтетическими вакансиями
+
+    Валюты, города, годы и зарплаты распределены примерно как в выгрузках hh.ru
+
+    :param file_name: Имя файла с расширением
+    :param rows: Кол-во строк
+    :param seed: Зерно генератора, одинаковое зерно даёт одинаковый файл
+    :param vacancies: Полный набор столбцов для режима Вакансии вместо столбцов статистики
+    """
+    from task2 import currency_to_rub
+
+    rnd = random.Random(seed)
+    currencies = rnd.choices(list(CURRENCIES), list(CURRENCIES.values()), k=1000)
+    cities = rnd.choices(list(CITIES), list(CITIES.values()), k=1000)
+    years = rnd.choices(list(YEARS), list(YEARS.values()), k=1000)
+    names = [level + name for level in LEVELS for name in PROFESSIONS]
+    with open(file_name, 'w', encoding='utf_8_sig', newline='') as file:
+        file.write(",".join(VACANCY_HEADER if vacancies else STATS_HEADER) + "\r\n")
+        for i in range(rows):
+            currency = currencies[rnd.randrange(1000)]
+            salary_from = round(rnd.lognormvariate(11.2, 0.5) / currency_to_rub[currency], -2) or 100
+            salary_to = round(salary_from * rnd.uniform(1, 1.6), -2)
+            published_at = f"{years[rnd.randrange(1000)]}-{rnd.randint(1, 12):02}-{rnd.randint(1, 28):02}" \
+                           f"T{rnd.randrange(24):02}:{rnd.randrange(60):02}:{rnd.randrange(60):02}+0300"
+            name, city = names[rnd.randrange(len(names))], cities[rnd.randrange(1000)]
+            if vacancies:
+                skills = "\n".join(rnd.sample(SKILLS, rnd.randint(1, 4)))
+                row = [name, DESCRIPTION, skills, rnd.choice(EXPERIENCE), rnd.choice(["True", "False"]),
+                       f"Компания {rnd.randrange(5000)}", f"{salary_from:.1f}", f"{salary_to:.1f}",
+                       rnd.choice(["True", "False"]), currency, city, published_at]
+                file.write(",".join(f'"{x}"' for x in row) + "\r\n")
+            else:
+                file.write(f"{name},{salary_from:.1f},{salary_to:.1f},{currency},{city},{published_at}\r\n")
+
+
+def dataset(rows, vacancies=False, seed=0, data_dir=DATA_DIR):
+    """ Возвращает путь к синтетическому csv файлу, создавая его при первом обращении
+
+    :param rows: Кол-во строк
+    :param vacancies: Полный набор столбцов для режима Вакансии
+    :param seed: Зерно генератора
+    :param data_dir: Папка для файлов
+    :return: str Имя файла
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    file_name = os.path.join(data_dir, f"{'vacancies' if vacancies else 'stats'}_{rows}_{seed}.csv")
+    if not os.path.exists(file_name):
+        generate_csv(file_name + ".tmp", rows, seed, vacancies)
+        os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+
+def measure(stage, rows, func, memory=True, repeat=REPEAT):
+    """ Замеряет лучшее из нескольких запусков время этапа и отдельным прогоном под tracemalloc пиковую память
+
+    Этап запускается несколько раз, поэтому func должна давать одинаковый результат при повторном вызове
+
+    :param stage: Название этапа
+    :param rows: Кол-во строк, обработанных этапом
+    :param func: Функция без аргументов
+    :param memory: Замерять ли пиковую память
+    :param repeat: Кол-во запусков для замера времени
+    :return: tuple Результат func и словарь с временем, строками в секунду и пиковой памятью в МБ
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds = min(seconds, time.perf_counter() - start)
+    result = dict(stage=stage, rows=rows, seconds=round(seconds, 4),
+                  rows_per_s=round(rows / seconds) if seconds else None)
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        finally:
+            tracemalloc.stop()
+    return value, result
+
+
+def bench_pipeline(rows, prof_name="Программист", memory=True, repeat=REPEAT, data_dir=DATA_DIR):
+    """ Замеряет по отдельности этапы статистики и режима Вакансии на синтетических данных
+
+    Режим Вакансии берёт не больше VACANCY_ROWS строк, а печать таблицы - первые PRINT_ROWS из них
+
+    :param rows: Кол-во строк файла статистики
+    :param prof_name: Имя профессии
+    :param memory: Замерять ли пиковую память
+    :param repeat: Кол-во запусков каждого этапа
+    :param data_dir: Папка для синтетических файлов и результатов генерации отчётов
+    :return: list(dict) Результаты этапов
+    """
+    import task2
+    import wtf
+
+    file_name = dataset(rows, data_dir=data_dir)
+    results = []
+
+    def run(stage, func, count=rows):
+        value, result = measure(stage, count, func, memory, repeat)
+        results.append(result)
+        return value
+
+    def legacy_dicts():
+        for counter in (task2.salary_all_years, task2.count_all_vacs, task2.salary_prof_years,
+                        task2.count_prof_vacs, task2.salary_city, task2.count_city_vacs):
+            counter.clear()
+        return task2.create_dicts(data[1:], prof_name)
+
+    def columns_cold():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(file_name + task2.CACHE_SUFFIX)
+        return task2.load_columns_cached(file_name)
+
+    data = run("csv_reader", lambda: task2.csv_reader(file_name))
+    keys, task2.Keys = task2.Keys, task2.ProfKeys(data[0])
+    try:
+        number = run("create_dicts", legacy_dicts)
+    finally:
+        task2.Keys = keys
+    run("calculate_part_city", lambda: task2.calculate_part_city(number))
+    run("sort", lambda: (task2.rank(task2.salary_city_part, 10), task2.rank(task2.part_city, 10)),
+        len(task2.count_city_vacs))
+    del data
+    run("load_columns_cached cold", columns_cold)
+    columns = run("load_columns_cached warm", lambda: task2.load_columns_cached(file_name))
+    report = run("columnar_partial", lambda: task2.columnar_partial(columns, prof_name).report())
+    image, excel = os.path.join(data_dir, "graph.png"), os.path.join(data_dir, "report.xlsx")
+    run("generate_excel", lambda: report.generate_excel(excel), len(report.years_l))
+    run("generate_image", lambda: report.generate_image(image), len(report.years_l))
+    run("render_reports", lambda: task2.render_reports([report], image, excel), len(report.years_l))
+
+    vacancy_rows = min(rows, VACANCY_ROWS)
+    reader = task2.csv_reader(dataset(vacancy_rows, vacancies=True, data_dir=data_dir))
+    vacancies = run("csv_filter", lambda: wtf.csv_filter(reader[1:], reader[0]), vacancy_rows)
+    with open(os.devnull, 'w', encoding='utf_8') as devnull, contextlib.redirect_stdout(devnull):
+        run("print_vacancies", lambda: wtf.print_vacancies(vacancies[:PRINT_ROWS], wtf.replacement_dic),
+            min(vacancy_rows, PRINT_ROWS))
+    size = os.path.getsize(file_name) / 1024 / 1024
+    for result in results[:1]:
+        result["mb_per_s"] = round(size / result["seconds"], 1)
+    return results
+
+
+def version():
+    """ Версия кода, на которой запущены замеры
+
+    :return: str Короткий хэш коммита с пометкой о незакоммиченных изменениях или "unknown"
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd, check=True,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def load_results(file_name=RESULTS_FILE):
+    """ Загружает сохранённые прогоны
+
+    :param file_name: Имя json файла
+    :return: list(dict) Прогоны от старых к новым
+    """
+    try:
+        with open(file_name, encoding='utf_8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def save_results(run, file_name=RESULTS_FILE):
+    """ Дописывает прогон к сохранённым
+
+    :param run: Словарь прогона
+    :param file_name: Имя json файла
+    """
+    runs = load_results(file_name) + [run]
+    with open(file_name + ".tmp", 'w', encoding='utf_8') as file:
+        json.dump(runs, file, ensure_ascii=False, indent=1)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def regressions(previous, current, threshold=REGRESSION):
+    """ Сравнивает прогон с предыдущим и находит этапы, ставшие медленнее
+
+    Время (seconds, ms) должно не расти, скорость (mb_per_s) - не падать, см. REGRESSION_METRICS
+
+    :param previous: Предыдущий прогон
+    :param current: Новый прогон
+    :param threshold: Во сколько раз этап должен замедлиться, чтобы попасть в список
+    :return: list(str) Описания замедлившихся этапов
+
+    >>> old = dict(version="a", results=[dict(stage="sort", rows=10, seconds=1.0)])
+    >>> new = dict(version="b", results=[dict(stage="sort", rows=10, seconds=1.5),
+    ...                                  dict(stage="csv", rows=10, seconds=1)])
+    >>> regressions(old, new)
+    ['sort (10 строк): 1.0 с -> 1.5 с, x1.50 после a']
+    """
+    before = {(x["stage"], x.get("rows")): x for x in previous["results"]}
+    found = []
+    for result in current["results"]:
+        old = before.get((result["stage"], result.get("rows")), {})
+        metric = next((x for x in REGRESSION_METRICS if result.get(x) is not None), None)
+        if metric is None or not old.get(metric):
+            continue
+        unit, higher = REGRESSION_METRICS[metric]
+        new = result[metric]
+        slowdown = (old[metric] / new if new else float("inf")) if higher else new / old[metric]
+        if slowdown > threshold:
+            rows = "" if result.get("rows") is None else f" ({result['rows']} строк)"
+            found.append(f"{result['stage']}{rows}: {old[metric]} {unit} -> {new} {unit}, x{slowdown:.2f} "
+                         f"после {previous['version']}")
+    return found
+
+
+if __name__ == '__main__':
+    sizes = [int(float(x)) for x in sys.argv[1:]] or SIZES
+    run = dict(version=version(), date=datetime.datetime.now().isoformat(timespec="seconds"),
+               python=platform.python_version(), results=[bench_startup(), *bench_clean()])
+    for rows in sizes:
+        run["results"] += bench_pipeline(rows)
+    for result in run["results"]:
+        print(result)
+    previous = load_results()
+    if previous:
+        for line in regressions(previous[-1], run) or ["Замедлений нет"]:
+            print(line)
+    save_results(run)
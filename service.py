@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import urllib.parse
+from http import HTTPStatus
+
+from task2 import FLAGS, PERIODS, columnar_partial, load_columns_cached, load_index, load_rates, stage
+
+HOST = "127.0.0.1"
+PORT = 8000
+CACHE_SIZE = 256
+MAX_HEADERS = 100
+
+_columns = None
+
+
+def _init_worker(file_name, rates):
+    """ Загружает столбцы датасета в процессе пула, если он не унаследовал их от родителя через fork
+
+    :param file_name: Имя csv файла
+    :param rates: RateTable или None
+    """
+    global _columns
+    if _columns is None:
+        _columns = load_columns_cached(file_name, processes=1, rates=rates)
+
+
+def profession_report(name, period="year", quantiles=False):
+    """ Считает статистику профессии по загруженному датасету, выполняется в процессе пула
+
+    :param name: Название профессии, пустая строка - все вакансии
+    :param period: Период динамики из PERIODS
+    :param quantiles: Считать ли p10, медиану и p90 зп
+    :return: dict Статистика, готовая для json
+    """
+    with stage("service_report") as record:
+        report = columnar_partial(_columns, name, period, quantiles).report()
+        record["rows"] = len(_columns["salary"])
+    return dict(profession=report.prof_name, period=report.period,
+                years=dict(periods=report.years_l, salary=report.year_sal_l, vacancies=report.year_vacs_l,
+                           quantiles=report.year_q_l),
+                profession_years=dict(salary=report.year_prof_sal_l, vacancies=report.year_prof_vacs_l,
+                                      quantiles=report.year_prof_q_l),
+                cities=dict(salary=dict(cities=report.city_A_l, salary=report.sal_A_l, quantiles=report.city_q_l),
+                            share=dict(cities=report.city_B_l, share=report.part_B_l)))
+
+
+class HttpError(Exception):
+    """ Ошибка запроса с http статусом ответа """
+
+    def __init__(self, status, message):
+        """ Инициализирует HttpError
+
+        :param status: HTTPStatus ответа
+        :param message: Текст ошибки для json ответа
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class StatsService:
+    """ Локальный http сервис статистики вакансий
+
+    Датасет загружается один раз в столбцы NumPy в родительском процессе, процессы пула получают их через fork
+    без копирования, поэтому запрос не читает csv. Сервису нужен NumPy, как и столбцовому движку task2.
+    Индекс названий отвечает 404 на неизвестную профессию, не занимая пул.
+    Подсчёт статистики выполняется в пуле процессов, цикл событий только разбирает запросы и отдаёт json.
+    Посчитанная статистика хранится в LRU кэше, одинаковые одновременные запросы ждут один и тот же подсчёт
+
+    Attributes:
+        file_name (str): Имя csv файла
+        cache_size (int): Сколько результатов хранить в кэше
+        cache (OrderedDict): Future статистики по ключу (профессия, период, квантили) в порядке использования
+        index (VacancyIndex): Индекс названий вакансий
+        executor (ProcessPoolExecutor): Пул процессов с загруженными столбцами
+    """
+
+    def __init__(self, file_name, processes=None, cache_size=CACHE_SIZE, rates=None):
+        """ Загружает датасет и запускает пул процессов
+
+        Процессы пула запускаются сразу, до открытия сокетов, иначе при fork они унаследуют сокеты соединений
+        и соединения не закроются, пока жив процесс пула
+
+        :param file_name: Имя csv файла
+        :param processes: Кол-во процессов пула, по умолчанию по числу ядер
+        :param cache_size: Сколько результатов хранить в кэше
+        :param rates: RateTable, None - фиксированные курсы
+        """
+        self.file_name = file_name
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        global _columns
+        _columns = load_columns_cached(file_name, rates=rates)
+        self.index = load_index(file_name)
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        self.executor = concurrent.futures.ProcessPoolExecutor(processes or os.cpu_count() or 1, context,
+                                                               initializer=_init_worker, initargs=(file_name, rates))
+        self.executor.submit(os.getpid).result()
+
+    def close(self):
+        """ Останавливает пул процессов """
+        self.executor.shutdown(cancel_futures=True)
+
+    async def report(self, name, period="year", quantiles=False):
+        """ Статистика профессии из кэша или посчитанная в пуле процессов
+
+        :param name: Название профессии
+        :param period: Период динамики
+        :param quantiles: Считать ли квантили
+        :return: dict Статистика
+        """
+        key = (name, period, quantiles)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return await asyncio.shield(self.cache[key])
+        future = asyncio.get_running_loop().run_in_executor(self.executor, profession_report, *key)
+        self.cache[key] = future
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self.cache.get(key) is future:
+                del self.cache[key]
+            raise
+
+    async def route(self, path, query):
+        """ Ответ на GET запрос
+
+        /profession?name=...&period=year&quantiles=1 - вся статистика профессии,
+        /years?period=year&quantiles=1 - динамика по всем вакансиям,
+        /cities?quantiles=1 - зп и доли вакансий по городам
+
+        :param path: Путь запроса
+        :param query: Словарь параметров запроса
+        :return: dict Тело ответа
+        """
+        period = query.get("period", "year")
+        if period not in PERIODS:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"period должен быть одним из: {', '.join(PERIODS)}")
+        quantiles = FLAGS.get(query.get("quantiles", "0").lower())
+        if quantiles is None:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"quantiles должен быть одним из: {', '.join(FLAGS)}")
+        if path == "/profession":
+            if not query.get("name"):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Не указан параметр name")
+            if not self.index.values("name", query["name"]):
+                raise HttpError(HTTPStatus.NOT_FOUND, f"Нет вакансий с названием: {query['name']}")
+            return await self.report(query["name"], period, quantiles)
+        if path == "/years":
+            result = await self.report("", period, quantiles)
+            return dict(period=period, **result["years"])
+        if path == "/cities":
+            return (await self.report("", "year", quantiles))["cities"]
+        raise HttpError(HTTPStatus.NOT_FOUND, f"Нет такого пути: {path}")
+
+    async def handle(self, reader, writer):
+        """ Обрабатывает одно соединение: читает запрос и отвечает json
+
+        :param reader: StreamReader соединения
+        :param writer: StreamWriter соединения
+        """
+        try:
+            status, body = HTTPStatus.OK, None
+            try:
+                request = (await reader.readline()).decode("latin_1").split()
+                if len(request) != 3:
+                    raise HttpError(HTTPStatus.BAD_REQUEST, "Неверная строка запроса")
+                method, target, _ = request
+                for _ in range(MAX_HEADERS):
+                    if (await reader.readline()).strip() == b"":
+                        break
+                else:
+                    raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Слишком много заголовков")
+                if method != "GET":
+                    raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Поддерживается только GET")
+                url = urllib.parse.urlsplit(target)
+                body = await self.route(url.path, dict(urllib.parse.parse_qsl(url.query)))
+            except HttpError as error:
+                status, body = error.status, dict(error=str(error))
+            except Exception as error:
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, dict(error=f"{type(error).__name__}: {error}")
+            data = json.dumps(body, ensure_ascii=False).encode("utf_8")
+            writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin_1") + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        """ Запускает сервер и обслуживает запросы до отмены
+
+        :param host: Адрес
+        :param port: Порт, 0 - любой свободный
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            print(f"Сервис статистики: http://{host}:{server.sockets[0].getsockname()[1]}", flush=True)
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный http сервис статистики вакансий, нужен NumPy")
+    parser.add_argument("file_name", help="csv файл с вакансиями")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--processes", type=int, help="Кол-во процессов для подсчёта статистики")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="Сколько результатов хранить в кэше")
+    parser.add_argument("--rates", help="csv с курсами валют, по умолчанию фиксированные курсы")
+    args = parser.parse_args()
+
+    service = StatsService(args.file_name, args.processes, args.cache_size, load_rates(args.rates))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -1,12 +1,96 @@
+import array
 import csv
 import codecs
+import collections
+import contextlib
+import copy
+import datetime
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import time
 from decimal import Decimal
-import openpyxl
-from openpyxl.styles import Font, Border, Side
-from matplotlib import pyplot as plt
-import numpy as np
-import doctest
-import unittest
+
+
+def _peak_rss():
+    """ Пиковый объём памяти процесса
+
+    :return: float Мегабайты или None, если платформа не даёт такой информации
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _numpy():
+    """ Модуль numpy, импортируется при первом обращении: построчным путям он не нужен
+
+    :return: module numpy
+    """
+    import numpy
+
+    return numpy
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """ Замеряет этап обработки, если инструментация включена переменными окружения
+
+    TASK2_STATS - файл, в который дописываются json строки с замерами этапов, "-" - вывод в stderr.
+    TASK2_PROFILE - этапы через запятую или "*", которые запускаются под cProfile,
+    профили сохраняются в папку TASK2_PROFILE_DIR как <этап>.<pid>.prof.
+    Без этих переменных этап ничего не замеряет. Также работает как декоратор.
+
+    :param name: Название этапа
+    :param rows: Кол-во строк, если оно известно заранее
+    :return: dict Запись этапа, в которую этап дописывает rows и skipped
+    """
+    record = dict(stage=name, rows=rows, skipped=None)
+    target = os.environ.get(STATS_ENV)
+    profiles = os.environ.get(PROFILE_ENV, "").split(",")
+    profiler = None
+    if (name in profiles or "*" in profiles) and not _profiling:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        _profiling.append(profiler)
+        profiler.enable()
+    elif not target:
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = type(error).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _profiling.remove(profiler)
+            profiler.dump_stats(os.path.join(os.environ.get(PROFILE_DIR_ENV, "."), f"{name}.{os.getpid()}.prof"))
+        if target:
+            record.update(seconds=round(seconds, 6),
+                          rows_per_s=round(record["rows"] / seconds) if record["rows"] and seconds else None,
+                          peak_rss_mb=_peak_rss(), pid=os.getpid())
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            if target == "-":
+                sys.stderr.write(line)
+            else:
+                with open(target, 'a', encoding='utf_8') as file:
+                    file.write(line)
 
 
 class Report:
@@ -25,10 +109,16 @@ class Report:
         sal_A_l (list(int)): Список средних зп по городам
         city_B_l (list(str)): Список городов для долей от общего кол-ва вакансий
         part_B_l (list(float)): Список соотношений от общего кол-ва вакансий
+        prof_name (str): Название выбранной профессии
+        period (str): Период динамики: year, quarter, month или week, ключи динамики - периоды
+        year_q_l (list(tuple)): p10, медиана и p90 зп по периодам, пустой без квантилей
+        year_prof_q_l (list(tuple)): p10, медиана и p90 зп по периодам для выбранной профессии
+        city_q_l (list(tuple)): p10, медиана и p90 зп для городов из city_A_l
     """
     year_prof_sal = year_prof_vacs = border = ""
 
-    def __init__(self, year_sal, year_vacs, year_prof_sal, year_prof_vacs, city_sal, city_part):
+    def __init__(self, year_sal, year_vacs, year_prof_sal, year_prof_vacs, city_sal, city_part, prof_name="",
+                 period="year", quantiles=None):
         """Инициализирует Report,
 
 
@@ -39,7 +129,12 @@ class Report:
             :param year_prof_vacs: Словарь с кол-вом профессий по годам для выбранной профессии
             :param city_sal: Словарь с уровнем зп по городам
             :param city_part: Словарь с долей вакансий по городам
+            :param prof_name: Название выбранной профессии
+            :param period: Период динамики из PERIODS
+            :param quantiles: Словарь year, year_prof и city с кортежами (p10, медиана, p90) по ключам или None
         """
+        self.prof_name = prof_name
+        self.period = period
         self.year_prof_sal = year_prof_sal
         self.year_prof_vacs = year_prof_vacs
         self.years_l = [*year_sal.keys()]
@@ -51,6 +146,11 @@ class Report:
         self.sal_A_l = [*city_sal.values()]
         self.city_B_l = [*city_part.keys()]
         self.part_B_l = [*city_part.values()]
+        quantiles = quantiles or dict(year={}, year_prof={}, city={})
+        empty = (0,) * len(QUANTILES)
+        self.year_q_l = [quantiles["year"].get(x, empty) for x in self.years_l] if quantiles["year"] else []
+        self.year_prof_q_l = [quantiles["year_prof"].get(x, empty) for x in self.years_l] if self.year_q_l else []
+        self.city_q_l = [quantiles["city"].get(x, empty) for x in self.city_A_l] if quantiles["city"] else []
 
     def print_data(self):
         """Выводит значения в консоль
@@ -58,35 +158,132 @@ class Report:
 
         """
 
-        print(f"Динамика уровня зарплат по годам: {dict(zip(self.years_l, self.year_sal_l))}")
-        print(f"Динамика количества вакансий по годам: {dict(zip(self.years_l, self.year_vacs_l))}")
-        print(f"Динамика уровня зарплат по годам для выбранной профессии: {self.year_prof_sal}")
-        print(f"Динамика количества вакансий по годам для выбранной профессии: {self.year_prof_vacs}")
+        by = PERIODS[self.period][1]
+        print(f"Динамика уровня зарплат по {by}: {dict(zip(self.years_l, self.year_sal_l))}")
+        print(f"Динамика количества вакансий по {by}: {dict(zip(self.years_l, self.year_vacs_l))}")
+        print(f"Динамика уровня зарплат по {by} для выбранной профессии: {self.year_prof_sal}")
+        print(f"Динамика количества вакансий по {by} для выбранной профессии: {self.year_prof_vacs}")
         print(f"Уровень зарплат по городам (в порядке убывания): {dict(zip(self.city_A_l, self.sal_A_l))}")
         print(f"Доля вакансий по городам (в порядке убывания): {dict(zip(self.city_B_l, self.part_B_l))}")
-
-    def generate_excel(self):
+        if self.year_q_l:
+            print(f"p10, медиана и p90 зарплат по {by}: {dict(zip(self.years_l, self.year_q_l))}")
+            print(f"p10, медиана и p90 зарплат по {by} для выбранной профессии: "
+                  f"{dict(zip(self.years_l, self.year_prof_q_l))}")
+        if self.city_q_l:
+            print(f"p10, медиана и p90 зарплат по городам: {dict(zip(self.city_A_l, self.city_q_l))}")
+
+    @stage("generate_excel")
+    def generate_excel(self, file_name="report.xlsx", write_only=False):
         """Создаёт report.xlsx файл с предоставленными данными
 
 
+        :param file_name: Имя файла для сохранения
+        :param write_only: Писать потоково через write_only книгу, не создавая объекты всех ячеек
         """
+        if write_only:
+            self._generate_excel_write_only(file_name)
+            return
+        import openpyxl
+        from openpyxl.styles import Border, Side
 
         wb = openpyxl.Workbook()
         ws1 = wb.active
-        ws1.title = "Статистика по годам"
+        ws1.title = f"Статистика по {PERIODS[self.period][1]}"
         ws2 = wb.create_sheet("Статистика по городам")
         ws2.append(['Город', 'Уровень зарплат', "", 'Город', 'Доля вакансий'])
         thin = Side(style="thin", color="FF000000")
         self.border = Border(left=thin, right=thin, top=thin, bottom=thin)
         self.fill_columns(1, 1, ws1, self.twod_array(
-            ["Год", "Средняя зарплата", f"Средняя зарплата - {prof_name}", "Количество вакансий",
-             f"Количество вакансий - {prof_name}"]))
+            [PERIODS[self.period][0], "Средняя зарплата", f"Средняя зарплата - {self.prof_name}", "Количество вакансий",
+             f"Количество вакансий - {self.prof_name}"]))
         self.fill_columns(1, 2, ws1, [self.years_l, self.year_sal_l, self.year_prof_sal_l,
                                       self.year_vacs_l, self.year_prof_vacs_l])
         self.fill_columns(1, 1, ws2, self.twod_array(['Город', 'Уровень зарплат', "", 'Город', 'Доля вакансий']))
         self.fill_columns(1, 2, ws2, [self.city_A_l, self.sal_A_l, [""] * 10, self.city_B_l, self.part_B_l])
         self._format_column_width(ws1, ws2)
-        wb.save("report.xlsx")
+        for ws, columns in self._quantile_columns():
+            ws = ws1 if ws is None else wb.create_sheet(ws)
+            start = ws.max_column + 1 if ws is ws1 else 1
+            self.fill_columns(start, 1, ws, self.twod_array([x[0] for x in columns]))
+            self.fill_columns(start, 2, ws, [x[1:] for x in columns])
+            self._set_max_width_and_styles(ws, len(columns[0]), start, start + len(columns) - 1)
+        wb.save(file_name)
+
+    def _quantile_columns(self):
+        """ Столбцы квантилей для листов excel
+
+        :return: list(tuple) Пары (название нового листа или None для листа по периодам, столбцы с заголовками)
+        """
+        names = ["p10", "Медиана", "p90"]
+        result = []
+        if self.year_q_l:
+            result.append((None, [[x, *column] for x, column in zip(names, zip(*self.year_q_l))] +
+                           [[f"{x} - {self.prof_name}", *column]
+                            for x, column in zip(names, zip(*self.year_prof_q_l))]))
+        if self.city_q_l:
+            result.append(("Квантили зарплат по городам", [["Город", *self.city_A_l]] +
+                           [[x, *column] for x, column in zip(names, zip(*self.city_q_l))]))
+        return result
+
+    def _generate_excel_write_only(self, file_name):
+        """ Создаёт такой же файл, как generate_excel, записывая строки потоком
+
+        Стили ячеек считаются один раз на каждое сочетание и копируются, ширина столбцов считается по
+        спискам отчёта до записи строк, так как в write_only книге размеры столбцов пишутся раньше данных
+
+        :param file_name: Имя файла для сохранения
+        """
+        import openpyxl
+        from openpyxl.styles import Font, Border, Side
+
+        wb = openpyxl.Workbook(write_only=True)
+        thin = Side(style="thin", color="FF000000")
+        styles = dict(border=Border(left=thin, right=thin, top=thin, bottom=thin), font=Font(bold=True))
+        quantiles = dict(self._quantile_columns())
+        self._write_only_sheet(wb, f"Статистика по {PERIODS[self.period][1]}", styles, [
+            [PERIODS[self.period][0], *self.years_l], ["Средняя зарплата", *self.year_sal_l],
+            [f"Средняя зарплата - {self.prof_name}", *self.year_prof_sal_l],
+            ["Количество вакансий", *self.year_vacs_l],
+            [f"Количество вакансий - {self.prof_name}", *self.year_prof_vacs_l],
+            *quantiles.pop(None, [])])
+        self._write_only_sheet(wb, "Статистика по городам", styles, [
+            ["Город", *self.city_A_l], ["Уровень зарплат", *self.sal_A_l], [""] * 11, ["Город", *self.city_B_l],
+            ["Доля вакансий", *self.part_B_l]])
+        for title, columns in quantiles.items():
+            self._write_only_sheet(wb, title, styles, columns)
+        wb.save(file_name)
+
+    def _write_only_sheet(self, wb, title, styles, columns):
+        """ Добавляет в write_only книгу лист со столбцами, первая строка - заголовки
+
+        :param wb: write_only книга
+        :param title: Название листа
+        :param styles: Словарь с общими border и font
+        :param columns: Список столбцов вместе с заголовками
+        """
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        ws = wb.create_sheet(title)
+        for i, col in enumerate(columns, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = max(len(str(x)) for x in col) + 2
+        style_arrays = {}
+        for row_index, row in enumerate(itertools.zip_longest(*columns)):
+            cells = []
+            for value in row:
+                cell = WriteOnlyCell(ws, value)
+                if value != "" and value is not None:
+                    kind = (row_index == 0, isinstance(value, float))
+                    if kind not in style_arrays:
+                        if kind[0]:
+                            cell.font = styles["font"]
+                        if kind[1]:
+                            cell.style = "Percent"
+                        cell.border = styles["border"]
+                        style_arrays[kind] = cell._style
+                    cell._style = copy.copy(style_arrays[kind])
+                cells.append(cell)
+            ws.append(cells)
 
     def twod_array(self, data: list):
         """ Переделывает каждый элемент листа в отделынй список
@@ -107,6 +304,7 @@ class Report:
         :param sheet: Страница excel для записис
         :param arrays: Список с списками, где каждый список это столбец
         """
+        from openpyxl.styles import Font
 
         max_col_index = len(arrays) - 1
         max_row_index = len(max(arrays, key=len))
@@ -132,47 +330,234 @@ class Report:
         self._set_max_width_and_styles(sheet1, len(self.years_l) + 1)
         self._set_max_width_and_styles(sheet2, len(self.city_A_l) + 10)
 
-    def _set_max_width_and_styles(self, sheet, length):
+    def _set_max_width_and_styles(self, sheet, length, min_col=1, max_col=5):
         """ Устанавливает ширину столбца по максимальн длинной строке в столбце
 
         :param sheet: Лист excel
         :param length: Глубина поиска в столбце
+        :param min_col: Первый столбец
+        :param max_col: Последний столбец
         """
-        for col in sheet.iter_cols(max_col=5, min_row=1, max_row=length):
+        for col in sheet.iter_cols(min_col=min_col, max_col=max_col, min_row=1, max_row=length):
             sheet.column_dimensions[col[0].column_letter].width = \
                 len(str(max(col, key=lambda x: len(str(x.value)) if x.value is not None else 0).value)) + 2
 
-    def generate_image(self):
+    def snapshot(self):
+        """ Снимок данных отчёта для отрисовки в других процессах
+
+        Списки заменяются кортежами, а словари копируются, поэтому отрисовка снимка не может поменять
+        данные отчёта и графики с таблицами можно создавать одновременно и в любом порядке
+
+        :return: Report Копия отчёта с неизменяемыми списками
+        """
+        result = copy.copy(self)
+        for key, value in vars(self).items():
+            if isinstance(value, list):
+                setattr(result, key, tuple(value))
+            elif isinstance(value, dict):
+                setattr(result, key, dict(value))
+        return result
+
+    @stage("generate_image")
+    def generate_image(self, file_name="graph.png", renderer=None):
         """ Создаёт изображение с графиками по данным
+
+        Данные отчёта не меняются
+
+        :param file_name: Имя файла для сохранения
+        :param renderer: ChartRenderer, фигуру которого можно переиспользовать, None - новая фигура
+        """
+        (renderer or ChartRenderer()).render(self, file_name)
+
+
+class ChartRenderer:
+    """ Рисует графики отчётов на одной и той же фигуре
+
+    Рисует на отдельной Figure без pyplot, поэтому не нужен GUI backend и фигуры не копятся в памяти.
+    Сетка 2x2, подписи осей и tight_layout строятся один раз для набора периодов и городов, у следующих отчётов
+    с теми же периодами и городами меняются только высоты столбцов, усы квантилей, легенды и круговая диаграмма
+
+    Attributes:
+        dpi (float): Разрешение изображения, None - из настроек matplotlib
+        format (str): Формат файла: png, svg и другие форматы matplotlib, None - по расширению имени файла
+        figure (Figure): Фигура с графиками, None до первого отчёта
+        layout (tuple): Период, периоды, города и наличие квантилей, для которых построена фигура
+    """
+
+    def __init__(self, dpi=None, format=None):
+        """ Инициализирует ChartRenderer
+
+        :param dpi: Разрешение изображения
+        :param format: Формат файла
+        """
+        self.dpi = dpi
+        self.format = format
+        self.figure = self.layout = self.axis = None
+        self.bars = self.errorbars = self.legends = self.pie = None
+
+    def render(self, report, file_name="graph.png"):
+        """ Рисует графики отчёта и сохраняет их в файл
+
+        :param report: Report
+        :param file_name: Имя файла или файловый объект
+        """
+        layout = (report.period, tuple(report.years_l), tuple(report.city_A_l), bool(report.year_q_l),
+                  bool(report.city_q_l))
+        if layout == self.layout:
+            self._update(report)
+        else:
+            self._build(report)
+            self.layout = layout
+        self.figure.savefig(file_name, dpi=self.dpi or "figure", format=self.format)
+
+    def _build(self, report):
+        """ Строит фигуру с нуля
+
+        :param report: Report
         """
-        figure, axis = plt.subplots(2, 2)
-        bar_x = np.arange(len(self.years_l))
-        axis[0, 0].bar(bar_x - 0.2, self.year_sal_l, 0.4, label="средняя з/п")
-        axis[0, 0].bar(bar_x + 0.2, self.year_prof_sal_l, 0.4, label=f"з/п {prof_name}")
-        axis[0, 0].set_xticks(bar_x, self.years_l, rotation=90, fontsize=8)
-        axis[0, 0].set_title("Уровень зарплат по годам")
-        axis[0, 0].legend(fontsize=8)
+        from matplotlib.figure import Figure
+
+        np = _numpy()
+        self.figure = Figure()
+        axis = self.axis = self.figure.subplots(2, 2)
+        bar_x = np.arange(len(report.years_l))
+        step = -(-len(report.years_l) // PERIOD_TICKS) or 1
+        by = PERIODS[report.period][1]
+        self.bars = [axis[0, 0].bar(bar_x - 0.2, report.year_sal_l, 0.4, label="средняя з/п"),
+                     axis[0, 0].bar(bar_x + 0.2, report.year_prof_sal_l, 0.4, label=f"з/п {report.prof_name}")]
+        self.errorbars = []
+        if report.year_q_l:
+            for offset, series in ((-0.2, report.year_q_l), (0.2, report.year_prof_q_l)):
+                low, median, high = (np.array(x) for x in zip(*series))
+                self.errorbars.append(axis[0, 0].errorbar(
+                    bar_x + offset, median, yerr=[median - low, high - median], fmt="o", ms=2, lw=0.6,
+                    color="black", label="медиана, p10-p90" if offset < 0 else None))
+        axis[0, 0].set_xticks(bar_x[::step], report.years_l[::step], rotation=90, fontsize=8)
+        axis[0, 0].set_title(f"Уровень зарплат по {by}")
+        self.legends = [axis[0, 0].legend(fontsize=8)]
         axis[0, 0].grid(visible=True, axis="y")
-        axis[0, 1].bar(bar_x - 0.2, self.year_vacs_l, 0.4, label="Количество вакансий")
-        axis[0, 1].bar(bar_x + 0.2, self.year_prof_vacs_l, 0.4, label=f"Количество вакансий \n{prof_name}")
-        axis[0, 1].set_xticks(bar_x, self.years_l, rotation=90, fontsize=8)
-        axis[0, 1].set_title("Количество вакансий по годам")
-        axis[0, 1].legend(loc="upper left", fontsize=8)
+        self.bars += [axis[0, 1].bar(bar_x - 0.2, report.year_vacs_l, 0.4, label="Количество вакансий"),
+                      axis[0, 1].bar(bar_x + 0.2, report.year_prof_vacs_l, 0.4,
+                                     label=f"Количество вакансий \n{report.prof_name}")]
+        axis[0, 1].set_xticks(bar_x[::step], report.years_l[::step], rotation=90, fontsize=8)
+        axis[0, 1].set_title(f"Количество вакансий по {by}")
+        self.legends.append(axis[0, 1].legend(loc="upper left", fontsize=8))
         axis[0, 1].grid(visible=True, axis="y")
-        for i in range(len(self.city_A_l)):
-            if self.city_A_l[i].count("-") == 1 or self.city_A_l[i].count(" ") == 1:
-                self.city_A_l[i] = self.city_A_l[i].replace("-", "-\n", 1).replace(" ", " \n", 1)
-        axis[1, 0].barh(np.arange(len(self.city_A_l)), self.sal_A_l, align="edge")
-        axis[1, 0].set_yticks(np.arange(len(self.city_A_l)), labels=self.city_A_l, fontsize=6)
+        cities = [x.replace("-", "-\n", 1).replace(" ", " \n", 1) if x.count("-") == 1 or x.count(" ") == 1 else x
+                  for x in report.city_A_l]
+        self.bars.append(axis[1, 0].barh(np.arange(len(cities)), report.sal_A_l, align="edge"))
+        if report.city_q_l:
+            low, median, high = (np.array(x) for x in zip(*report.city_q_l))
+            self.errorbars.append(axis[1, 0].errorbar(
+                median, np.arange(len(cities)) + 0.4, xerr=[median - low, high - median], fmt="o", ms=2, lw=0.6,
+                color="black"))
+        axis[1, 0].set_yticks(np.arange(len(cities)), labels=cities, fontsize=6)
         axis[1, 0].invert_yaxis()
         axis[1, 0].grid(visible=True, axis="x")
         axis[1, 0].set_title("Уровень зарплат по городам")
-        self.part_B_l = [1 - sum(self.part_B_l)] + self.part_B_l
-        self.city_B_l = ["Другие"] + self.city_B_l
-        axis[1, 1].pie(self.part_B_l, labels=self.city_B_l, textprops={'fontsize': 6})
-        axis[1, 1].set_title("Доля вакансий по городам")
-        plt.tight_layout()
-        plt.savefig('graph.png')
+        self._draw_pie(report)
+        self.figure.tight_layout()
+
+    def _draw_pie(self, report):
+        """ Рисует круговую диаграмму долей вакансий по городам
+
+        :param report: Report
+        """
+        self.pie = (tuple(report.part_B_l), tuple(report.city_B_l))
+        self.axis[1, 1].pie([1 - sum(report.part_B_l), *report.part_B_l], labels=["Другие", *report.city_B_l],
+                            textprops={'fontsize': 6})
+        self.axis[1, 1].set_title("Доля вакансий по городам")
+
+    def _update(self, report):
+        """ Меняет данные на уже построенной фигуре с теми же периодами и городами
+
+        :param report: Report
+        """
+        np = _numpy()
+        for container, values in zip(self.bars, (report.year_sal_l, report.year_prof_sal_l, report.year_vacs_l,
+                                                 report.year_prof_vacs_l, report.sal_A_l)):
+            for patch, value in zip(container, values):
+                (patch.set_width if container.orientation == "horizontal" else patch.set_height)(value)
+        series = ([report.year_q_l, report.year_prof_q_l] if report.year_q_l else []) + \
+                 ([report.city_q_l] if report.city_q_l else [])
+        limits = {}
+        for container, values in zip(self.errorbars, series):
+            low, median, high = (np.array(x) for x in zip(*values))
+            line, _, (lines,) = container.lines
+            x, y = line.get_data()
+            if container.has_xerr:
+                line.set_xdata(median)
+                segments = np.stack([np.column_stack([low, y]), np.column_stack([high, y])], axis=1)
+            else:
+                line.set_ydata(median)
+                segments = np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1)
+            lines.set_segments(segments)
+            limits.setdefault(line.axes, []).append(segments.reshape(-1, 2))
+        self.legends[0].get_texts()[1].set_text(f"з/п {report.prof_name}")
+        self.legends[1].get_texts()[1].set_text(f"Количество вакансий \n{report.prof_name}")
+        for axis in (self.axis[0, 0], self.axis[0, 1], self.axis[1, 0]):
+            axis.relim()
+            for points in limits.get(axis, ()):
+                axis.update_datalim(points)
+            axis.autoscale_view()
+        if self.pie != (tuple(report.part_B_l), tuple(report.city_B_l)):
+            self.axis[1, 1].clear()
+            self._draw_pie(report)
+
+
+def _render(task):
+    """ Создаёт график или excel файл по снимку отчёта, выполняется в отдельном процессе
+
+    Графики рисуются на ChartRenderer, общем для всех задач процесса с тем же разрешением
+
+    :param task: Кортеж (снимок Report, "image" или "excel", имя файла, писать ли excel потоково, dpi графика)
+    :return: str Имя созданного файла
+    """
+    report, kind, file_name, write_only, dpi = task
+    if kind == "image":
+        if dpi not in _renderers:
+            _renderers[dpi] = ChartRenderer(dpi)
+        report.generate_image(file_name, _renderers[dpi])
+    else:
+        report.generate_excel(file_name, write_only)
+    return file_name
+
+
+def render_reports(reports, image="graph.png", excel="report.xlsx", processes=None, write_only=False, dpi=None):
+    """ Создаёт графики и excel файлы отчётов одновременно в нескольких процессах
+
+    В процессы передаются снимки отчётов, график и таблица одного отчёта создаются параллельно,
+    а задачи многих отчётов раздаются процессам пачками.
+    Имена файлов - шаблоны str.format с полями i (номер отчёта) и name (название профессии)
+    или списки имён для каждого отчёта, формат графика берётся по расширению: png, svg и другие форматы matplotlib
+
+    :param reports: Список Report
+    :param image: Шаблон имени графика или список имён, None - не создавать графики
+    :param excel: Шаблон имени excel файла или список имён, None - не создавать таблицы
+    :param processes: Кол-во процессов, по умолчанию по числу ядер, 1 - без пула процессов
+    :param write_only: Писать excel потоково
+    :param dpi: Разрешение графиков, None - из настроек matplotlib
+    :return: list(tuple) Пары (имя графика, имя excel файла) для каждого отчёта
+    """
+    snapshots = [report.snapshot() for report in reports]
+    names = [tuple(x[i] if isinstance(x, (list, tuple)) else None if x is None else x.format(i=i, name=report.prof_name)
+                   for x in (image, excel)) for i, report in enumerate(snapshots)]
+    files = [x for pair in names for x in pair if x is not None]
+    if len(set(files)) != len(files):
+        raise ValueError("Имена файлов отчётов совпадают, добавьте в шаблон {i} или {name}")
+    tasks = [(report, kind, file_name, write_only, dpi) for report, pair in zip(snapshots, names)
+             for kind, file_name in zip(("image", "excel"), pair) if file_name is not None]
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    with stage("render_reports", len(snapshots)):
+        if processes <= 1:
+            for task in tasks:
+                _render(task)
+        else:
+            import multiprocessing
+
+            with multiprocessing.Pool(processes) as pool:
+                pool.map(_render, tasks)
+    return names
 
 
 class ProfKeys:
@@ -184,7 +569,9 @@ class ProfKeys:
             salary_currency (str): Валюта зп
             area_name (str): Место вакансии
             published_at (str): Дата публикации
+            columns (tuple(str)): Заголовки столбцов, нужных для статистики
     """
+    columns = ('name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at')
 
     def __init__(self, headers):
         """ Инициализирует класс с данными
@@ -222,6 +609,312 @@ currency_to_rub = {
     "UZS": 0.0055,
 }
 
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+QUOTE_SCAN_BLOCK = 1024 * 1024
+COLUMN_BATCH = 500_000
+FINGERPRINT_BLOCK = 1024 * 1024
+CACHE_SUFFIX = ".cache.npz"
+STATE_SUFFIX = ".stats.json"
+INDEX_SUFFIX = ".index.npz"
+INDEX_COLUMNS = ("name", "key_skills")
+STATS_ENV = "TASK2_STATS"
+PROFILE_ENV = "TASK2_PROFILE"
+PROFILE_DIR_ENV = "TASK2_PROFILE_DIR"
+PERIODS = dict(year=("Год", "годам"), quarter=("Квартал", "кварталам"), month=("Месяц", "месяцам"),
+               week=("Неделя", "неделям"))
+PERIOD_TICKS = 24
+COLUMN_ARRAYS = ("year", "day", "salary", "city", "name")
+QUANTILES = (0.1, 0.5, 0.9)
+FLAGS = {"1": True, "true": True, "0": False, "false": False}
+SKETCH_K = 200
+SKETCH_C = 2 / 3
+SKETCH_NUMPY_SORT = 10_000
+EXACT_SCALE = 1126
+EXACT_PIECE = 18
+CSV_FIELD = re.compile(rb'(?:"[^"]*(?:""[^"]*)*"|[^,"\r\n]*)(,|\r?\n|\Z)')
+VACANCY_FIELDS = ("name", "description", "key_skills", "experience_id", "premium", "employer_name", "salary_from",
+                  "salary_to", "salary_gross", "salary_currency", "area_name", "published_at")
+VACANCY_NUMBERS = ("salary_from", "salary_to")
+VACANCY_FLAGS = ("premium", "salary_gross")
+VACANCY_CODES = ("experience_id", "salary_currency", "area_name")
+_profiling = []
+_renderers = {}
+
+
+def _shared_values(convert, values):
+    """ Разбор значения, при котором одинаковые значения разбираются один раз и дают один и тот же объект
+
+    :param convert: Функция разбора значения
+    :param values: Словарь уже разобранных значений, дополняется
+    :return: function Разбор значения
+
+    >>> parse = _shared_values(float, {})
+    >>> parse("10") is parse("10")
+    True
+    """
+    def shared(value):
+        result = values.get(value)
+        if result is None:
+            result = values[value] = convert(value)
+        return result
+    return shared
+
+
+def day_ordinal(published_at):
+    """ Номер дня публикации, как у datetime.date.toordinal
+
+    :param published_at: Дата в формате ГГГГ-ММ-ДД..., без месяца или дня считается первое число
+    :return: int Номер дня
+
+    >>> datetime.date.fromordinal(day_ordinal("2022-07-05T10:00:00+0300"))
+    datetime.date(2022, 7, 5)
+    >>> datetime.date.fromordinal(day_ordinal("2007"))
+    datetime.date(2007, 1, 1)
+    """
+    return datetime.date(int(published_at[:4]), int(published_at[5:7] or 1), int(published_at[8:10] or 1)).toordinal()
+
+
+class Vacancy:
+    """ Компактная запись вакансии вместо списка строк или словаря
+
+    Поля хранятся в __slots__, границы оклада разобраны в float, premium и salary_gross - bool,
+    дата публикации - номер дня. Коды опыта, валюты и города и дни публикации повторяются и их немного,
+    поэтому они разбираются один раз и хранятся одним объектом на все записи; остальные поля не делятся,
+    чтобы таблица общих значений не росла с числом строк. Поля, которых нет в файле, равны None
+
+    Attributes:
+        name (str): Название
+        description (str): Описание
+        key_skills (str): Навыки через перевод строки
+        experience_id (str): Код опыта работы
+        premium (bool): Премиум-вакансия
+        employer_name (str): Компания
+        salary_from (float): Нижняя граница оклада
+        salary_to (float): Верхняя граница оклада
+        salary_gross (bool): Оклад указан до вычета налогов
+        salary_currency (str): Код валюты
+        area_name (str): Город
+        published_at (int): День публикации, см. day_ordinal
+        other (dict(str,str)): Столбцы файла, которых нет в VACANCY_FIELDS, по заголовкам
+    """
+    __slots__ = (*VACANCY_FIELDS, "other")
+
+    def __getattr__(self, name):
+        """ Поле, которого не было в файле
+
+        :param name: Название поля
+        :return: None
+        """
+        if name in self.__slots__:
+            return None
+        raise AttributeError(name)
+
+    def __eq__(self, other):
+        """ Записи равны, если равны все поля
+
+        :param other: Другая запись
+        :return: bool
+        """
+        return type(other) is Vacancy and all(getattr(self, x) == getattr(other, x) for x in self.__slots__)
+
+    def __repr__(self):
+        """ Заполненные поля записи
+
+        :return: str
+        """
+        fields = (f"{x}={getattr(self, x)!r}" for x in self.__slots__ if getattr(self, x) is not None)
+        return f"Vacancy({', '.join(fields)})"
+
+    @classmethod
+    def records(cls, rows, header, text=None, shared=None):
+        """ Записи из строк csv, строки с пустыми полями или другим числом полей пропускаются
+
+        Столбцы, которых нет в VACANCY_FIELDS, сохраняются строками в other
+
+        :param rows: Строки данных без заголовка
+        :param header: Заголовки столбцов
+        :param text: Функция (поле, значение) для всех полей до разбора, например очистка от html, None - как есть
+        :param shared: Словарь общих значений кодов и дней по полям, можно передавать между вызовами
+        :return: generator(Vacancy) Записи
+
+        >>> rows = [["Python", "10", "30", "RUR", "A", "2007", "x"], ["Java", "", "1", "RUR", "A", "2007", "y"]]
+        >>> record, = Vacancy.records(rows, [*ProfKeys.columns, "id"])
+        >>> record.salary_from, record.area_name, record.premium, record.other
+        (10.0, 'A', None, {'id': 'x'})
+        """
+        shared = {} if shared is None else shared
+        parsers = dict.fromkeys(VACANCY_NUMBERS, float) | dict.fromkeys(VACANCY_FLAGS, "True".__eq__)
+        days = _shared_values(day_ordinal, shared.setdefault("published_at", {}))
+        setters = []
+        for field in header:
+            clean = None if text is None else functools.partial(text, field)
+            if field not in VACANCY_FIELDS:
+                setters.append((None, clean))
+                continue
+            if field == "published_at":
+                convert = (lambda value: days(value[:10])) if clean is None else \
+                    lambda value, clean=clean: days(clean(value)[:10])
+            else:
+                parse = parsers.get(field)
+                if clean is None:
+                    convert = parse
+                elif parse is None:
+                    convert = clean
+                else:
+                    convert = lambda value, clean=clean, parse=parse: parse(clean(value))
+                if field in VACANCY_CODES:
+                    convert = _shared_values(convert or str, shared.setdefault(field, {}))
+            setters.append((cls.__dict__[field].__set__, convert))
+        width, other = len(header), [i for i, x in enumerate(header) if x not in VACANCY_FIELDS]
+        for line in rows:
+            if all(line) and len(line) == width:
+                record = object.__new__(cls)
+                for (setter, convert), value in zip(setters, line):
+                    if setter is not None:
+                        setter(record, value if convert is None else convert(value))
+                if other:
+                    record.other = {header[i]: line[i] if setters[i][1] is None else setters[i][1](line[i])
+                                    for i in other}
+                yield record
+
+
+class RateTable:
+    """ Курсы валют к рублю по месяцам для перевода зарплат по дате публикации вакансии
+
+    Курсы хранятся плотным массивом месяц x валюта, поэтому для строки нужны только два индекса.
+    Пропуски заполняются так: месяц без курса берёт последний известный курс до него, месяцы до первого
+    известного курса - первый известный курс, даты вне таблицы - курс крайнего месяца таблицы,
+    валюты, которых нет в таблице, - фиксированный курс из currency_to_rub.
+
+    Attributes:
+        first (int): Номер первого месяца таблицы, год * 12 + месяц - 1
+        codes (dict(str,int)): Номера столбцов валют
+        table (numpy.ndarray): Курсы, строки - месяцы, столбцы - валюты
+        rows (list(list(float))): Те же курсы списками для построчного подсчёта
+        monthly (dict(str,list)): Строки rows по началу даты ГГГГ-ММ, чтобы построчно не разбирать дату
+        fingerprint (str): Хэш курсов, входит в ключ кэша столбцов
+    """
+
+    def __init__(self, rates, fallback=None):
+        """ Строит плотную таблицу курсов
+
+        :param rates: Словарь курсов по месяцам {"ГГГГ-ММ": {валюта: курс}}
+        :param fallback: Курсы для валют, которых нет в таблице, по умолчанию currency_to_rub
+        """
+        np = _numpy()
+        fallback = currency_to_rub if fallback is None else fallback
+        months = [int(x[:4]) * 12 + int(x[5:7]) - 1 for x in rates]
+        self.first = min(months, default=0)
+        currencies = list(dict.fromkeys([*fallback, *(x for values in rates.values() for x in values)]))
+        self.codes = {x: i for i, x in enumerate(currencies)}
+        table = np.full((max(months, default=0) - self.first + 1, len(currencies)), np.nan)
+        for month, values in zip(months, rates.values()):
+            for currency, rate in values.items():
+                table[month - self.first, self.codes[currency]] = rate
+        for currency, i in self.codes.items():
+            known = np.flatnonzero(~np.isnan(table[:, i]))
+            if len(known):
+                previous = np.searchsorted(known, np.arange(len(table)), side="right") - 1
+                table[:, i] = table[known[np.maximum(previous, 0)], i]
+            else:
+                table[:, i] = fallback[currency]
+        self.table = table
+        self.rows = table.tolist()
+        self.monthly = {f"{(self.first + i) // 12}-{(self.first + i) % 12 + 1:02}": row
+                        for i, row in enumerate(self.rows)}
+        self.fingerprint = hashlib.blake2b(repr((self.first, currencies)).encode() + table.tobytes(),
+                                           digest_size=16).hexdigest()
+
+    @classmethod
+    def from_csv(cls, file_name):
+        """ Загружает курсы из csv файла с заголовком date,<валюта>,...
+
+        Дата строки может быть днём или месяцем, берётся её начало ГГГГ-ММ. Пустая ячейка - нет курса.
+
+        :param file_name: Имя файла с расширением
+        :return: RateTable Таблица курсов
+        """
+        rates = {}
+        with open(file_name, 'r', encoding='utf_8_sig', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            for line in reader:
+                if line and line[0]:
+                    rates.setdefault(line[0][:7], {}).update(
+                        {x: float(value) for x, value in zip(header[1:], line[1:]) if value})
+        return cls(rates)
+
+    def month(self, published_at):
+        """ Номер строки таблицы для даты публикации
+
+        :param published_at: Дата в формате ГГГГ-ММ..., без месяца считается январь
+        :return: int Номер строки
+        """
+        month = int(published_at[:4]) * 12 + int(published_at[5:7] or 1) - 1 - self.first
+        return min(max(month, 0), len(self.rows) - 1)
+
+    def _month_row(self, published_at):
+        """ Строка курсов для даты вне таблицы или без месяца, запоминается в monthly
+
+        :param published_at: Дата публикации
+        :return: list(float) Курсы по номерам валют
+        """
+        row = self.monthly[published_at[:7]] = self.rows[self.month(published_at)]
+        return row
+
+    def rate(self, currency, published_at):
+        """ Курс валюты к рублю в месяце публикации
+
+        :param currency: Код валюты
+        :param published_at: Дата публикации
+        :return: float Курс
+        """
+        return (self.monthly.get(published_at[:7]) or self._month_row(published_at))[self.codes[currency]]
+
+    def salary(self, salary_from, salary_to, currency, published_at):
+        """ Средняя зп в рублях по курсу месяца публикации
+
+        :param salary_from: Нижняя граница оклада
+        :param salary_to: Верхняя граница оклада
+        :param currency: Код валюты
+        :param published_at: Дата публикации
+        :return: float Средняя зп
+
+        >>> rates = RateTable({"2007-01": {"USD": 26.5}, "2007-03": {"USD": 26.0}})
+        >>> rates.salary("100", "300", "USD", "2007-02-10T10:00:00+0300")
+        5300.0
+        >>> rates.salary("100", "300", "USD", "2022-01-01T10:00:00+0300")
+        5200.0
+        >>> rates.salary("100", "300", "EUR", "2007")
+        11980.0
+        """
+        rate = (self.monthly.get(published_at[:7]) or self._month_row(published_at))[self.codes[currency]]
+        return rate * (float(salary_from) + float(salary_to)) / 2
+
+    def column(self, currencies, published):
+        """ Курсы для массивов валют и дат публикации, даты разбираются только по уникальным месяцам
+
+        :param currencies: Массив кодов валют
+        :param published: Массив дат публикации
+        :return: numpy.ndarray Курсы
+        """
+        np = _numpy()
+        currency_values, currency_idx = np.unique(currencies, return_inverse=True)
+        months, month_idx = np.unique(published.astype("U7"), return_inverse=True)
+        rows = np.array([self.month(x) for x in months.tolist()], dtype=np.intp)
+        cols = np.array([self.codes[x] for x in currency_values.tolist()], dtype=np.intp)
+        return self.table[rows[month_idx.reshape(-1)], cols[currency_idx.reshape(-1)]]
+
+
+def load_rates(file_name=None):
+    """ Загружает таблицу курсов, только если файл курсов указан явно
+
+    :param file_name: Имя файла с расширением, None или пустая строка - без таблицы
+    :return: RateTable Таблица курсов или None, тогда используются фиксированные курсы currency_to_rub
+    """
+    return RateTable.from_csv(file_name) if file_name else None
+
+
 salary_all_years = {}
 count_all_vacs = {}
 salary_prof_years = {}
@@ -266,10 +959,11 @@ def fill_gaps(cur: dict, ref: dict, filler):
     return temp
 
 
-def year(ls):
+def year(ls, keys=None):
     """ Извлекает год из списка
 
     :param ls: Список
+    :param keys: ProfKeys с индексами столбцов, по умолчанию глобальный Keys
     :return: int Год из списка
 
     >>> Keys.published_at = 2
@@ -281,7 +975,62 @@ def year(ls):
     1234
 
     """
-    return int(ls[Keys.published_at][0:4])
+    return int(ls[(keys or Keys).published_at][0:4])
+
+
+def period_key(published_at, period="year"):
+    """ Ключ периода для даты публикации
+
+    :param published_at: Дата в формате ISO
+    :param period: Период из PERIODS
+    :return: int Год для периода year, иначе str вида 2022, 2022-Q3, 2022-07 или 2022-W27
+
+    >>> [period_key('2022-07-05T18:19:30+0300', x) for x in PERIODS]
+    [2022, '2022-Q3', '2022-07', '2022-W27']
+
+    >>> period_key('2021-01-01T10:00:00+0300', 'week')
+    '2020-W53'
+    """
+    if period == "year":
+        return int(published_at[:4])
+    if period == "quarter":
+        return f"{published_at[:4]}-Q{(int(published_at[5:7] or 1) + 2) // 3}"
+    if period == "month":
+        return f"{published_at[:4]}-{published_at[5:7] or '01'}"
+    if period == "week":
+        iso = datetime.date.fromisoformat(published_at[:10]).isocalendar()
+        return f"{iso[0]}-W{iso[1]:02}"
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def period_buckets(columns, period="year"):
+    """ Векторно считает ключи периодов по столбцу дней публикации
+
+    :param columns: Столбцы из load_columns
+    :param period: Период из PERIODS
+    :return: tuple Массив кодов периодов и словарь их названий, для year - годы и None
+    """
+    np = _numpy()
+    if period == "year":
+        return columns["year"], None
+    days = columns["day"].astype(np.int64)
+    if period in ("quarter", "month"):
+        months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        codes = months // 3 if period == "quarter" else months
+    elif period == "week":
+        thursdays = days - (days + 3) % 7 + 3
+        years = thursdays.astype("datetime64[D]").astype("datetime64[Y]")
+        codes = years.astype(np.int64) * 53 + (thursdays - years.astype("datetime64[D]").astype(np.int64)) // 7
+    else:
+        raise ValueError(f"Неизвестный период: {period}")
+    uniq = np.unique(codes).tolist()
+    if period == "quarter":
+        labels = {x: f"{1970 + x // 4}-Q{x % 4 + 1}" for x in uniq}
+    elif period == "month":
+        labels = {x: f"{1970 + x // 12}-{x % 12 + 1:02}" for x in uniq}
+    else:
+        labels = {x: f"{1970 + x // 53}-W{x % 53 + 1:02}" for x in uniq}
+    return codes, labels
 
 
 def sal(*sal_list):
@@ -300,6 +1049,38 @@ def sal(*sal_list):
     return currency_to_rub[sal_list[2]] * (float(sal_list[0]) + float(sal_list[1])) / 2
 
 
+def exact(value):
+    """ Переводит число в целое кол-во единиц 2**-EXACT_SCALE без округления
+
+    Суммы зп хранятся такими целыми, поэтому не зависят от порядка сложения: куски файла,
+    посчитанные в разных процессах, сливаются в тот же результат, что и последовательный подсчёт
+
+    :param value: float Значение
+    :return: int Значение, умноженное на 2**EXACT_SCALE
+
+    >>> exact(1.5) == 3 << (EXACT_SCALE - 1)
+    True
+    >>> exact(0.1) + exact(0.2) == exact(0.1 + 0.2)
+    False
+    """
+    numerator, denominator = value.as_integer_ratio()
+    return numerator << (EXACT_SCALE + 1 - denominator.bit_length())
+
+
+def exact_mean(total, count):
+    """ Целая часть среднего по точной сумме из exact
+
+    :param total: int Точная сумма
+    :param count: int Кол-во слагаемых
+    :return: int Среднее, отброшенная дробная часть как у int()
+
+    >>> exact_mean(exact(35000.0) + exact(20000.5), 2)
+    27500
+    """
+    mean = abs(total) // (count << EXACT_SCALE)
+    return mean if total >= 0 else -mean
+
+
 def for_loop_div(key_source: dict, divide: dict, action):
     """ Выполняет action от divide[x] и key_source[x] для каждого ключа из key_source
 
@@ -312,19 +1093,1226 @@ def for_loop_div(key_source: dict, divide: dict, action):
         divide[x] = action(divide[x], key_source[x])
 
 
+class QuantileSketch:
+    """ Поточный KLL скетч для приближённых квантилей с ограниченной памятью
+
+    Значения лежат по уровням, значение уровня h весит 2^h. Переполненный уровень сортируется и отдаёт
+    на следующий уровень каждое второе значение, поэтому хранится O(k log(n / k)) значений.
+    Пока значений меньше ёмкости нижнего уровня, квантили точные. Скетчи кусков данных сливаются через merge.
+
+    Attributes:
+        k (int): Ёмкость верхнего уровня, ошибка ранга порядка 1 / k
+        count (int): Кол-во учтённых значений
+        levels (list(list(float))): Значения по уровням
+    """
+
+    def __init__(self, k=SKETCH_K, seed=0):
+        """ Создаёт пустой скетч
+
+        :param k: Ёмкость верхнего уровня
+        :param seed: С каких значений, чётных или нечётных, начинается сжатие, дальше выбор чередуется
+        """
+        self.k = k
+        self.count = 0
+        self.levels = [[]]
+        self.capacities = [k]
+        self._coin = seed % 2
+
+    def _grow(self):
+        """ Добавляет уровень и пересчитывает ёмкости, нижние уровни становятся меньше """
+        self.levels.append([])
+        height = len(self.levels)
+        self.capacities = [max(2, math.ceil(self.k * SKETCH_C ** (height - h - 1))) for h in range(height)]
+
+    def _compress(self):
+        """ Сжимает переполненные уровни снизу вверх """
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) >= self.capacities[h]:
+                if h + 1 == len(self.levels):
+                    self._grow()
+                if len(level) >= SKETCH_NUMPY_SORT:
+                    np = _numpy()
+                    level = np.sort(np.asarray(level, dtype=np.float64)).tolist()
+                else:
+                    level.sort()
+                odd = len(level) % 2
+                self.levels[h + 1].extend(level[self._coin:len(level) - odd:2])
+                self._coin ^= 1
+                self.levels[h] = level[len(level) - odd:]
+            h += 1
+
+    def update(self, value):
+        """ Учитывает значение
+
+        :param value: Число
+        :return: QuantileSketch self
+        """
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self.capacities[0]:
+            self._compress()
+        return self
+
+    def update_many(self, values):
+        """ Учитывает сразу много значений, например столбец NumPy
+
+        :param values: Список или массив чисел
+        :return: QuantileSketch self
+        """
+        values = values.tolist() if hasattr(values, "tolist") else list(values)
+        self.levels[0].extend(values)
+        self.count += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """ Добавляет значения другого скетча
+
+        :param other: QuantileSketch
+        :return: QuantileSketch self
+        """
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, values in zip(self.levels, other.levels):
+            level.extend(values)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def dump(self):
+        """ Состояние скетча для json
+
+        :return: dict Ёмкость, кол-во значений, уровни и очередной выбор при сжатии
+        """
+        return dict(k=self.k, count=self.count, levels=self.levels, coin=self._coin)
+
+    @classmethod
+    def load(cls, state):
+        """ Восстанавливает скетч из состояния dump
+
+        :param state: dict Состояние
+        :return: QuantileSketch Скетч
+        """
+        sketch = cls(state["k"], state["coin"])
+        while len(sketch.levels) < len(state["levels"]):
+            sketch._grow()
+        sketch.levels = [[float(x) for x in level] for level in state["levels"]]
+        sketch.count = int(state["count"])
+        return sketch
+
+    def quantiles(self, points=QUANTILES):
+        """ Приближённые квантили
+
+        :param points: Доли от 0 до 1
+        :return: list(float) Значения квантилей, для пустого скетча нули
+
+        >>> QuantileSketch().update_many(range(1, 101)).quantiles()
+        [10, 50, 90]
+        """
+        items = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+        total = sum(weight for _, weight in items)
+        result = []
+        for point in points:
+            seen, target = 0, point * total
+            value = 0
+            for value, weight in items:
+                seen += weight
+                if seen >= target:
+                    break
+            result.append(value)
+        return result
+
+
+def _sketch(group, key):
+    """ Скетч группы по ключу, создаётся при первом обращении
+
+    :param group: Словарь скетчей
+    :param key: Ключ группы
+    :return: QuantileSketch Скетч
+    """
+    sketch = group.get(key)
+    if sketch is None:
+        sketch = group[key] = QuantileSketch()
+    return sketch
+
+
+class VacancyStats:
+    """ Накапливает суммы зарплат и кол-ва вакансий по годам, городам и выбранной профессии
+
+    Все счётчики принадлежат объекту, поэтому в одном процессе можно считать несколько отчётов сразу.
+    Части данных считаются в отдельных объектах (в потоках или процессах) и сливаются через merge.
+
+    Attributes:
+        name (str): Название профессии, None - статистика по профессии не считается
+        keys (ProfKeys): Индексы нужных столбцов в строках
+        number (int): Число учтённых вакансий
+        salary_all_years (dict(int,int)): Точная сумма зп по годам, см. exact
+        count_all_vacs (dict(int,int)): Кол-во вакансий по годам
+        salary_prof_years (dict(int,int)): Точная сумма зп по годам для выбранной профессии
+        count_prof_vacs (dict(int,int)): Кол-во вакансий по годам для выбранной профессии
+        salary_city (dict(str,int)): Точная сумма зп по городам
+        count_city_vacs (dict(str,int)): Кол-во вакансий по городам
+        skipped (int): Число строк, пропущенных из-за пустых полей
+        rates (RateTable): Курсы по месяцам, None - фиксированные курсы currency_to_rub
+        period (str): Период динамики из PERIODS, ключи "годовых" словарей - периоды
+        sketches (dict): Скетчи квантилей зп year, year_prof и city по ключам или None, если квантили не нужны
+    """
+    skipped = 0
+    rates = None
+    period = "year"
+    sketches = None
+    counters = ("salary_all_years", "count_all_vacs", "salary_prof_years", "count_prof_vacs", "salary_city",
+                "count_city_vacs")
+
+    def __init__(self, name, keys=None, rates=None, period="year", quantiles=False):
+        """ Инициализирует пустой накопитель
+
+        :param name: Название профессии
+        :param keys: ProfKeys с индексами столбцов, нужен только для update
+        :param rates: RateTable для перевода зп по дате публикации
+        :param period: Период динамики из PERIODS
+        :param quantiles: Считать ли медиану и p10/p90 зп скетчами
+        """
+        self.name = name
+        self.keys = keys
+        self.rates = rates
+        self.period = period
+        self.sketches = dict(year={}, year_prof={}, city={}) if quantiles else None
+        self.number = 0
+        self.salary_all_years = {}
+        self.count_all_vacs = {}
+        self.salary_prof_years = {}
+        self.count_prof_vacs = {}
+        self.salary_city = {}
+        self.count_city_vacs = {}
+
+    def update(self, rows):
+        """ Учитывает строки данных, строки с пустыми полями пропускаются
+
+        :param rows: Строки данных без заголовка
+        :return: VacancyStats self
+
+        >>> stats = VacancyStats('Python', ProfKeys(list(ProfKeys.columns)))
+        >>> stats.update([['Python', '10', '30', 'RUR', 'A', '2007'], ['Java', '1', '', 'RUR', 'A', '2007']]).number
+        1
+        >>> stats.salary_prof_years == {2007: exact(20.0)}
+        True
+        """
+        keys, rates, period, buckets, sketches = self.keys, self.rates, self.period, {}, self.sketches
+        for line in rows:
+            if all(line):
+                self.number += 1
+                line_year = year(line, keys) if period == "year" else self._bucket(line[keys.published_at], buckets)
+                if rates is None:
+                    salary = sal(line[keys.salary_from], line[keys.salary_to], line[keys.salary_currency])
+                else:
+                    salary = rates.salary(line[keys.salary_from], line[keys.salary_to], line[keys.salary_currency],
+                                          line[keys.published_at])
+                amount = exact(salary)
+                addToDict(line_year, self.salary_all_years, amount)
+                addToDict(line[keys.area_name], self.salary_city, amount)
+                addToDict(line_year, self.count_all_vacs, 1)
+                addToDict(line[keys.area_name], self.count_city_vacs, 1)
+                if self.name is not None and self.name in line[keys.name]:
+                    addToDict(line_year, self.salary_prof_years, amount)
+                    addToDict(line_year, self.count_prof_vacs, 1)
+                    if sketches is not None:
+                        _sketch(sketches["year_prof"], line_year).update(salary)
+                if sketches is not None:
+                    _sketch(sketches["year"], line_year).update(salary)
+                    _sketch(sketches["city"], line[keys.area_name]).update(salary)
+            else:
+                self.skipped += 1
+        return self
+
+    def _bucket(self, published_at, buckets):
+        """ Ключ периода с запоминанием по дню публикации, чтобы каждый день разбирался один раз
+
+        :param published_at: Дата публикации
+        :param buckets: Словарь уже разобранных дней
+        :return: str Ключ периода
+        """
+        day = published_at[:10]
+        key = buckets.get(day)
+        if key is None:
+            key = buckets[day] = period_key(day, self.period)
+        return key
+
+    def update_profession(self, rows):
+        """ Учитывает строки только в статистике по профессии, общие счётчики не меняются
+
+        Нужен, когда строки профессии уже отобраны, например по индексу названий
+
+        :param rows: Строки данных без заголовка
+        :return: VacancyStats self
+        """
+        keys, rates, period, buckets = self.keys, self.rates, self.period, {}
+        for line in rows:
+            if all(line) and self.name in line[keys.name]:
+                line_year = year(line, keys) if period == "year" else self._bucket(line[keys.published_at], buckets)
+                if rates is None:
+                    salary = sal(line[keys.salary_from], line[keys.salary_to], line[keys.salary_currency])
+                else:
+                    salary = rates.salary(line[keys.salary_from], line[keys.salary_to], line[keys.salary_currency],
+                                          line[keys.published_at])
+                addToDict(line_year, self.salary_prof_years, exact(salary))
+                addToDict(line_year, self.count_prof_vacs, 1)
+                if self.sketches is not None:
+                    _sketch(self.sketches["year_prof"], line_year).update(salary)
+        return self
+
+    def merge(self, other):
+        """ Добавляет счётчики другого накопителя, считавшего следующую часть данных
+
+        :param other: VacancyStats
+        :return: VacancyStats self
+        """
+        self.number += other.number
+        self.skipped += other.skipped
+        for counter in self.counters:
+            target = getattr(self, counter)
+            for x, val in getattr(other, counter).items():
+                addToDict(x, target, val)
+        if other.sketches is not None:
+            if self.sketches is None:
+                self.sketches = dict(year={}, year_prof={}, city={})
+            for group, sketches in other.sketches.items():
+                for x, sketch in sketches.items():
+                    _sketch(self.sketches[group], x).merge(sketch)
+        return self
+
+    def dump(self):
+        """ Состояние накопителя для json, счётчики хранятся парами (ключ, значение), чтобы не терять тип ключей
+
+        :return: dict Состояние
+        """
+        return dict(name=self.name, number=self.number, skipped=self.skipped,
+                    counters={x: list(getattr(self, x).items()) for x in self.counters},
+                    sketches=None if self.sketches is None else {
+                        group: [(x, sketch.dump()) for x, sketch in sketches.items()]
+                        for group, sketches in self.sketches.items()})
+
+    @classmethod
+    def load(cls, state, keys=None, rates=None, period="year"):
+        """ Восстанавливает накопитель из состояния dump
+
+        :param state: dict Состояние
+        :param keys: ProfKeys с индексами столбцов
+        :param rates: RateTable, с которыми считалось состояние
+        :param period: Период, по которому считалось состояние
+        :return: VacancyStats Накопитель
+        """
+        stats = cls(state["name"], keys, rates, period)
+        stats.number, stats.skipped = int(state["number"]), int(state["skipped"])
+        for counter in cls.counters:
+            setattr(stats, counter, dict(state["counters"][counter]))
+        if state["sketches"] is not None:
+            stats.sketches = {group: {x: QuantileSketch.load(sketch) for x, sketch in state["sketches"][group]}
+                              for group in ("year", "year_prof", "city")}
+        return stats
+
+    @stage("report")
+    def report(self, top=10):
+        """ Строит Report по накопленным данным
+
+        :param top: Кол-во городов в рейтингах
+        :return: Report Отчёт
+        """
+        year_sal = {x: exact_mean(self.salary_all_years[x], y) for x, y in self.count_all_vacs.items()}
+        year_prof_sal = {x: exact_mean(self.salary_prof_years[x], y) for x, y in self.count_prof_vacs.items()}
+        year_prof_vacs = dict(self.count_prof_vacs)
+        city_part, city_sal = {}, {}
+        for x, count in self.count_city_vacs.items():
+            calc_num = Decimal(count / self.number).quantize(Decimal("1.0000"))
+            if calc_num >= 0.01:
+                city_part[x] = calc_num.__float__()
+                city_sal[x] = exact_mean(self.salary_city[x], count)
+        fill(year_prof_sal, year_sal, 0)
+        fill(year_prof_vacs, self.count_all_vacs, 0)
+        quantiles = None if self.sketches is None else {
+            group: {x: tuple(int(q) for q in sketch.quantiles()) for x, sketch in sketches.items()}
+            for group, sketches in self.sketches.items()}
+        return Report(year_sal, dict(self.count_all_vacs), year_prof_sal, year_prof_vacs,
+                      dict(rank(city_sal, top)), dict(rank(city_part, top)), self.name or "", self.period, quantiles)
+
+
 def csv_reader(file_name):
     """ Считывает данные из csv файла
 
     :param file_name: Имя файла с расщирением
     :return: list Список данных
     """
-    file = codecs.open(file_name, 'r', 'utf_8_sig')
-    reader = csv.reader(file)
-    data = list(reader)
-    file.close()
+    with stage("csv_reader") as record:
+        file = codecs.open(file_name, 'r', 'utf_8_sig')
+        reader = csv.reader(file)
+        data = list(reader)
+        file.close()
+        record["rows"] = len(data)
     return data
 
 
+def csv_rows(file_name):
+    """ Построчно считывает данные из csv файла, не загружая его в память целиком
+
+    :param file_name: Имя файла с расширением
+    :return: generator Генератор строк файла, первой идёт строка заголовков
+    """
+    with open(file_name, 'r', encoding='utf_8_sig', newline='') as file:
+        yield from csv.reader(file)
+
+
+def _next_record_boundary(mm, start, target):
+    """ Ищет начало первой записи csv после позиции target
+
+    Кавычки считаются от start (заведомо начало записи), поэтому перевод строки внутри
+    поля в кавычках границей не считается.
+
+    :param mm: mmap файла
+    :param start: Позиция начала записи, от которой считаются кавычки
+    :param target: Позиция, после которой ищется граница
+    :return: int Позиция начала следующей записи
+    """
+    quotes = 0
+    for block_start in range(start, target, QUOTE_SCAN_BLOCK):
+        quotes += mm[block_start:min(block_start + QUOTE_SCAN_BLOCK, target)].count(b'"')
+    pos = target
+    while True:
+        new_line = mm.find(b'\n', pos)
+        if new_line == -1:
+            return len(mm)
+        quotes += mm[pos:new_line + 1].count(b'"')
+        pos = new_line + 1
+        if quotes % 2 == 0:
+            return pos
+
+
+def split_file(file_name, parts):
+    """ Делит csv файл на куски по байтам, выровненные по границам записей
+
+    :param file_name: Имя файла с расширением
+    :param parts: Желаемое кол-во кусков
+    :return: tuple(list, list) Заголовки и список пар (начало, конец) кусков без заголовка
+    """
+    size = os.path.getsize(file_name)
+    if size == 0:
+        return [], []
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = len(codecs.BOM_UTF8) if mm[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+        bounds = [_next_record_boundary(mm, start, start)]
+        step = (size - bounds[0]) // parts
+        for i in range(1, parts):
+            bounds.append(_next_record_boundary(mm, bounds[-1], max(bounds[0] + i * step, bounds[-1])))
+    bounds.append(size)
+    header = next(csv.reader(_chunk_lines(file_name, start, bounds[0])), [])
+    return header, [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def _chunk_lines(file_name, start, end):
+    """ Построчно читает байты файла из промежутка [start, end)
+
+    :param file_name: Имя файла с расширением
+    :param start: Начало промежутка
+    :param end: Конец промежутка
+    :return: generator Генератор декодированных строк
+    """
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        pos = start
+        while pos < end:
+            line = file.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode('utf_8')
+
+
+def aggregate_chunk(task):
+    """ Считает статистику по куску файла, выполняется в отдельном процессе
+
+    :param task: Кортеж (имя файла, начало, конец, ProfKeys, имя профессии, RateTable, нужны ли квантили)
+    :return: VacancyStats Статистика по куску
+    """
+    file_name, start, end, keys, name, rates, quantiles = task
+    return VacancyStats(name, keys, rates, quantiles=quantiles).update(csv.reader(_chunk_lines(file_name, start, end)))
+
+
+def aggregate_file(file_name, name, processes=None, rates=None, quantiles=False):
+    """ Считает статистику по csv файлу в нескольких процессах
+
+    Куски сливаются по порядку, поэтому порядок ключей совпадает с последовательным подсчётом
+
+    :param file_name: Имя файла с расширением
+    :param name: Имя профессии
+    :param processes: Кол-во процессов, по умолчанию по числу ядер
+    :param rates: RateTable, None - фиксированные курсы
+    :param quantiles: Считать ли медиану и p10/p90 зп, скетчи кусков сливаются
+    :return: VacancyStats Статистика по файлу
+    """
+    import multiprocessing
+
+    processes = processes or os.cpu_count() or 1
+    header, chunks = split_file(file_name, processes * 4)
+    keys = ProfKeys(header)
+    with multiprocessing.Pool(processes) as pool:
+        partials = pool.map(aggregate_chunk, [(file_name, start, end, keys, name, rates, quantiles)
+                                              for start, end in chunks])
+    stats = VacancyStats(name, keys, rates, quantiles=quantiles)
+    for partial in partials:
+        stats.merge(partial)
+    return stats
+
+
+def create_dicts_parallel(file_name, name, processes=None, rates=None):
+    """ Создаёт словари для заполнения Report класса, считая куски файла в нескольких процессах
+
+    :param file_name: Имя файла с расширением
+    :param name: Имя профессии
+    :param processes: Кол-во процессов, по умолчанию по числу ядер
+    :param rates: RateTable, None - фиксированные курсы
+    :return: int Общее число вакансий
+    """
+    return merge_partials([aggregate_file(file_name, name, processes, rates)])
+
+
+def merge_partials(partials):
+    """ Сливает частичные результаты в глобальные словари для заполнения Report класса и считает средние зп
+
+    :param partials: Список VacancyStats в порядке следования данных
+    :return: int Общее число вакансий
+    """
+    targets = dict(salary_all_years=salary_all_years, count_all_vacs=count_all_vacs,
+                   salary_prof_years=salary_prof_years, count_prof_vacs=count_prof_vacs,
+                   salary_city=salary_city, count_city_vacs=count_city_vacs)
+    number = 0
+    for partial in partials:
+        number += partial.number
+        for key, target in targets.items():
+            for x, val in getattr(partial, key).items():
+                addToDict(x, target, val)
+    for_loop_div(count_all_vacs, salary_all_years, exact_mean)
+    for_loop_div(count_prof_vacs, salary_prof_years, exact_mean)
+    return number
+
+
+def _complete_records(file_name, start, stop=None, complete=True):
+    """ Читает записи csv с позиции start, не трогая недописанную последнюю запись
+
+    :param file_name: Имя файла с расширением
+    :param start: Позиция начала записи
+    :param stop: Позиция начала записи, на которой чтение останавливается, по умолчанию конец файла
+    :param complete: Если False, последняя запись без перевода строки тоже читается
+    :return: generator Пары (строка, позиция сразу после неё)
+    """
+    state = dict(pos=start, stopped=False)
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+
+        def lines():
+            while stop is None or state["pos"] < stop:
+                line = file.readline()
+                if not line.endswith(b'\n'):
+                    if complete or not line:
+                        state["stopped"] = True
+                        return
+                    stop_after = True
+                else:
+                    stop_after = False
+                state["pos"] += len(line)
+                yield line.decode('utf_8')
+                if stop_after:
+                    return
+
+        try:
+            for row in csv.reader(lines()):
+                if state["stopped"]:
+                    return
+                yield row, state["pos"]
+        except csv.Error:
+            return
+
+
+def _append_check(file_name, offset):
+    """ Хэш начала файла и блока перед offset, по нему видно, что файл только дописывался
+
+    :param file_name: Имя файла с расширением
+    :param offset: Позиция, до которой файл уже обработан
+    :return: str Хэш
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as file:
+        digest.update(file.read(min(offset, FINGERPRINT_BLOCK)))
+        file.seek(max(0, offset - FINGERPRINT_BLOCK))
+        digest.update(file.read(offset - file.tell()))
+    return digest.hexdigest()
+
+
+def update_stats(file_name, name, rates=None, period="year", quantiles=False):
+    """ Досчитывает статистику по записям, дописанным в конец файла с прошлого запуска
+
+    Суммы, кол-ва и скетчи по каждой запрошенной профессии хранятся в json рядом с csv файлом вместе
+    с позицией, до которой файл обработан, отпечатком курсов и периодом. Если файл изменился не только
+    дописыванием, курсы или период другие, или файл состояния не читается, всё считается заново.
+    Последняя запись без перевода строки учитывается в результате, но не в состоянии: её могут ещё дописывать.
+
+    :param file_name: Имя файла с расширением
+    :param name: Имя профессии
+    :param rates: RateTable, None - фиксированные курсы
+    :param period: Период динамики из PERIODS
+    :param quantiles: Считать ли медиану и p10/p90 зп скетчами
+    :return: VacancyStats Статистика по всему файлу
+    """
+    state_name = file_name + STATE_SUFFIX
+    fingerprint = "" if rates is None else rates.fingerprint
+    try:
+        with open(state_name, encoding='utf_8') as file:
+            state = json.load(file)
+        if state["offset"] > os.path.getsize(file_name) or state["check"] != _append_check(file_name, state["offset"]) \
+                or state["rates"] != fingerprint or state["period"] != period:
+            raise ValueError(state_name)
+        keys = ProfKeys(state["header"])
+        stats = {x: VacancyStats.load(y, keys, rates, period) for x, y in state["stats"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        with open(file_name, 'rb') as file:
+            start = len(codecs.BOM_UTF8) if file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 0
+        header = next(_complete_records(file_name, start), None)
+        if header is None:
+            return VacancyStats(name, rates=rates, period=period, quantiles=quantiles)
+        state = dict(header=header[0], header_end=header[1], offset=header[1])
+        keys, stats = ProfKeys(header[0]), {}
+    if name not in stats or quantiles and stats[name].sketches is None:
+        stats[name] = VacancyStats(name, keys, rates, period, quantiles).update(
+            row for row, _ in _complete_records(file_name, state["header_end"], state["offset"]))
+    end = state["offset"]
+    for row, end in _complete_records(file_name, state["offset"]):
+        for x in stats.values():
+            x.update((row,))
+    state.update(offset=end, check=_append_check(file_name, end), rates=fingerprint, period=period,
+                 stats={x: y.dump() for x, y in stats.items()})
+    try:
+        with open(state_name + ".tmp", 'w', encoding='utf_8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(state_name + ".tmp", state_name)
+    except OSError:
+        pass
+    result = stats[name]
+    tail = [row for row, _ in _complete_records(file_name, end, complete=False) if len(row) == len(state["header"])]
+    if tail:
+        result = copy.deepcopy(result).update(tail)
+    if quantiles or result.sketches is None:
+        return result
+    result = copy.copy(result)
+    result.sketches = None
+    return result
+
+
+class VacancyIndex:
+    """ Индекс триграмм по названиям вакансий и навыкам, хранится рядом с csv файлом
+
+    Значения столбцов сильно повторяются, поэтому триграммы указывают на различные значения,
+    а у каждого значения хранится список номеров строк
+
+    Attributes:
+        fingerprint (str): Отпечаток csv файла, по которому построен индекс
+        header (list(str)): Заголовки csv файла
+        offsets (array): Позиции начала строк в файле, последний элемент - конец последней строки
+        columns (dict): Для каждого столбца значения, номера их строк и триграммы
+    """
+    gram = 3
+
+    def __init__(self, file_name, columns=INDEX_COLUMNS):
+        """ Строит индекс по csv файлу
+
+        :param file_name: Имя файла с расширением
+        :param columns: Заголовки индексируемых столбцов, отсутствующие в файле пропускаются
+        """
+        self.fingerprint = file_fingerprint(file_name)
+        with open(file_name, 'rb') as file:
+            start = len(codecs.BOM_UTF8) if file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 0
+        records = _complete_records(file_name, start, complete=False)
+        self.header, end = next(records, ([], start))
+        indexes = {x: self.header.index(x) for x in columns if x in self.header}
+        self.offsets = array.array('q', [end])
+        value_ids = {x: {} for x in indexes}
+        self.columns = {x: dict(values=[], rows=[], grams={}) for x in indexes}
+        for row_id, (row, end) in enumerate(records):
+            self.offsets.append(end)
+            for column, i in indexes.items():
+                if i >= len(row):
+                    continue
+                value_id = value_ids[column].get(row[i])
+                if value_id is None:
+                    value_id = value_ids[column][row[i]] = self._add_value(self.columns[column], row[i])
+                self.columns[column]["rows"][value_id].append(row_id)
+
+    def _add_value(self, column, value):
+        """ Добавляет новое значение столбца в индекс
+
+        :param column: Словарь индекса столбца
+        :param value: Значение
+        :return: int Номер значения
+        """
+        value_id = len(column["values"])
+        column["values"].append(value)
+        column["rows"].append(array.array('I'))
+        for gram in {value[i:i + self.gram] for i in range(len(value) - self.gram + 1)}:
+            column["grams"].setdefault(gram, array.array('I')).append(value_id)
+        return value_id
+
+    def values(self, column, text):
+        """ Находит различные значения столбца, содержащие подстроку
+
+        :param column: Заголовок столбца
+        :param text: Подстрока
+        :return: list(int) Номера значений
+        """
+        column = self.columns[column]
+        if len(text) >= self.gram:
+            grams = sorted({text[i:i + self.gram] for i in range(len(text) - self.gram + 1)},
+                           key=lambda x: len(column["grams"].get(x, ())))
+            candidates = set(column["grams"].get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates.intersection_update(column["grams"].get(gram, ()))
+        else:
+            candidates = range(len(column["values"]))
+        return [x for x in candidates if text in column["values"][x]]
+
+    def lookup(self, column, text):
+        """ Находит строки, в которых значение столбца содержит подстроку
+
+        :param column: Заголовок столбца
+        :param text: Подстрока
+        :return: list(int) Номера строк по возрастанию
+
+        >>> index = VacancyIndex.__new__(VacancyIndex)
+        >>> index.columns = dict(name=dict(values=[], rows=[], grams={}))
+        >>> for row_id, value in enumerate(['Python dev', 'Java dev', 'Python lead']):
+        ...     index.columns['name']['rows'][index._add_value(index.columns['name'], value)].append(row_id)
+        >>> index.lookup('name', 'Python')
+        [0, 2]
+        >>> index.lookup('name', 'v')
+        [0, 1]
+        >>> index.lookup('name', 'Ruby')
+        []
+        """
+        rows = self.columns[column]["rows"]
+        return sorted(itertools.chain.from_iterable(rows[x] for x in self.values(column, text)))
+
+    def rows(self, file_name, row_ids):
+        """ Читает из файла только строки с указанными номерами
+
+        :param file_name: Имя файла с расширением
+        :param row_ids: Номера строк
+        :return: generator Строки csv
+        """
+        with open(file_name, 'rb') as file:
+            for row_id in row_ids:
+                file.seek(self.offsets[row_id])
+                data = file.read(self.offsets[row_id + 1] - self.offsets[row_id]).decode('utf_8')
+                yield next(csv.reader(io.StringIO(data, newline='')))
+
+    def dump(self):
+        """ Массивы индекса для np.savez: значения одной строкой байт, списки номеров подряд с концами списков
+
+        :return: dict Массивы по именам
+        """
+        np = _numpy()
+        data = dict(fingerprint=np.array(self.fingerprint), header=np.array(self.header, dtype=str),
+                    offsets=np.frombuffer(self.offsets, dtype=np.int64), columns=np.array([*self.columns], dtype=str))
+        for i, column in enumerate(self.columns.values()):
+            data[f"values{i}"], data[f"value_ends{i}"] = _pack_strings(column["values"])
+            data[f"rows{i}"], data[f"row_ends{i}"] = _pack_ids(column["rows"])
+            data[f"grams{i}"] = np.array([*column["grams"]], dtype=str)
+            data[f"gram_values{i}"], data[f"gram_ends{i}"] = _pack_ids(column["grams"].values())
+        return data
+
+    @classmethod
+    def load(cls, data):
+        """ Восстанавливает индекс из массивов dump
+
+        :param data: Массивы по именам, например NpzFile
+        :return: VacancyIndex Индекс
+        """
+        index = cls.__new__(cls)
+        index.fingerprint = data["fingerprint"].item()
+        index.header = data["header"].tolist()
+        index.offsets = array.array('q')
+        index.offsets.frombytes(data["offsets"].tobytes())
+        index.columns = {}
+        for i, name in enumerate(data["columns"].tolist()):
+            index.columns[name] = dict(values=_unpack_strings(data[f"values{i}"], data[f"value_ends{i}"]),
+                                       rows=_unpack_ids(data[f"rows{i}"], data[f"row_ends{i}"]),
+                                       grams=dict(zip(data[f"grams{i}"].tolist(),
+                                                      _unpack_ids(data[f"gram_values{i}"], data[f"gram_ends{i}"]))))
+        return index
+
+
+def _pack_ids(lists):
+    """ Склеивает списки номеров array('I') в один массив
+
+    :param lists: Списки номеров
+    :return: tuple(numpy.ndarray, numpy.ndarray) Номера подряд и концы списков
+    """
+    np = _numpy()
+    lists = list(lists)
+    return (np.frombuffer(b"".join(x.tobytes() for x in lists), dtype=np.uint32),
+            np.cumsum([len(x) for x in lists], dtype=np.int64))
+
+
+def _pack_strings(values):
+    """ Склеивает строки в один массив байт utf-8, чтобы короткие строки не дополнялись до длины самой длинной
+
+    :param values: Строки
+    :return: tuple(numpy.ndarray, numpy.ndarray) Байты подряд и концы строк
+    """
+    np = _numpy()
+    values = [x.encode('utf_8') for x in values]
+    return np.frombuffer(b"".join(values), dtype=np.uint8), np.cumsum([len(x) for x in values], dtype=np.int64)
+
+
+def _unpack_strings(blob, ends):
+    """ Разрезает байты из _pack_strings обратно на строки
+
+    :param blob: Байты подряд
+    :param ends: Концы строк
+    :return: list(str) Строки
+    """
+    blob, ends = blob.tobytes(), ends.tolist()
+    return [blob[a:b].decode('utf_8') for a, b in zip([0, *ends], ends)]
+
+
+def _unpack_ids(ids, ends):
+    """ Разрезает номера из _pack_ids обратно на списки array('I')
+
+    :param ids: Номера подряд
+    :param ends: Концы списков
+    :return: list Списки номеров
+    """
+    data, start, lists = ids.tobytes(), 0, []
+    for end in ends.tolist():
+        part = array.array('I')
+        part.frombytes(data[start * part.itemsize:end * part.itemsize])
+        lists.append(part)
+        start = end
+    return lists
+
+
+def load_index(file_name, columns=INDEX_COLUMNS):
+    """ Загружает индекс из файла рядом с csv, перестраивая его при изменении csv файла
+
+    :param file_name: Имя файла с расширением
+    :param columns: Заголовки индексируемых столбцов
+    :return: VacancyIndex Индекс
+    """
+    np = _numpy()
+    index_name = file_name + INDEX_SUFFIX
+    try:
+        with np.load(index_name) as data:
+            index = VacancyIndex.load(data)
+        if index.fingerprint == file_fingerprint(file_name) and \
+                set(index.columns) == {x for x in columns if x in index.header}:
+            return index
+    except (OSError, KeyError, ValueError):
+        pass
+    index = VacancyIndex(file_name, columns)
+    try:
+        with open(index_name + ".tmp", 'wb') as file:
+            np.savez(file, **index.dump())
+        os.replace(index_name + ".tmp", index_name)
+    except OSError:
+        pass
+    return index
+
+
+def profession_stats(file_name, name, index=None, rates=None, period="year"):
+    """ Считает статистику по профессии, читая из csv только строки с её названием
+
+    Общая статистика берётся из кэша столбцов, строки профессии находятся по индексу названий
+
+    :param file_name: Имя файла с расширением
+    :param name: Имя профессии
+    :param index: VacancyIndex, по умолчанию загружается load_index
+    :param rates: RateTable, None - фиксированные курсы
+    :param period: Период динамики из PERIODS
+    :return: VacancyStats Статистика
+    """
+    index = index or load_index(file_name)
+    stats = VacancyStats(name, ProfKeys(index.header), rates, period).merge(
+        columnar_partial(load_columns_cached(file_name, rates=rates), None, period))
+    return stats.update_profession(index.rows(file_name, index.lookup("name", name)))
+
+
+def _factorize(values, codes):
+    """ Переводит значения в коды, новые значения получают коды в порядке первого появления
+
+    :param values: Массив значений
+    :param codes: Словарь значение - код, дополняется новыми значениями
+    :return: np.ndarray Массив кодов
+
+    >>> import numpy as np
+    >>> codes = {'b': 0}
+    >>> _factorize(np.array(['a', 'b', 'a', 'c']), codes).tolist()
+    [1, 0, 1, 2]
+    >>> codes
+    {'b': 0, 'a': 1, 'c': 2}
+    """
+    np = _numpy()
+    uniq, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    for i in np.argsort(first, kind="stable"):
+        codes.setdefault(uniq[i].item(), len(codes))
+    return np.array([codes[x.item()] for x in uniq], dtype=np.int32)[inverse.reshape(-1)]
+
+
+def load_columns(rows, keys, batch_size=COLUMN_BATCH, rates=None):
+    """ Разбирает строки в типизированные столбцы NumPy, строки с пустыми полями пропускаются
+
+    :param rows: Строки данных без заголовка
+    :param keys: ProfKeys с индексами столбцов
+    :param batch_size: Кол-во строк, разбираемых за раз
+    :param rates: RateTable для перевода зп по месяцу публикации, None - фиксированные курсы
+    :return: dict Столбцы year, day (дни с 1970-01-01), salary, city, name и списки cities, names для расшифровки
+    """
+    np = _numpy()
+    city_codes, name_codes = {}, {}
+    parts = {x: [] for x in COLUMN_ARRAYS}
+    batch = []
+
+    def flush():
+        salary_from, salary_to, currency, published, area, name = map(np.array, zip(*batch))
+        if rates is None:
+            currencies, currency_idx = np.unique(currency, return_inverse=True)
+            rate = np.array([currency_to_rub[x] for x in currencies.tolist()],
+                            dtype=np.float64)[currency_idx.reshape(-1)]
+        else:
+            rate = rates.column(currency, published)
+        parts["salary"].append(rate * (salary_from.astype(np.float64) + salary_to.astype(np.float64)) / 2)
+        days = published.astype("U10").astype("datetime64[D]")
+        parts["day"].append(days.astype(np.int32))
+        parts["year"].append(days.astype("datetime64[Y]").astype(np.int32) + 1970)
+        parts["city"].append(_factorize(area, city_codes))
+        parts["name"].append(_factorize(name, name_codes))
+        batch.clear()
+
+    with stage("load_columns") as record:
+        total = skipped = 0
+        for total, line in enumerate(rows, 1):
+            if all(line):
+                batch.append((line[keys.salary_from], line[keys.salary_to], line[keys.salary_currency],
+                              line[keys.published_at], line[keys.area_name], line[keys.name]))
+                if len(batch) >= batch_size:
+                    flush()
+            else:
+                skipped += 1
+        if batch:
+            flush()
+        record.update(rows=total, skipped=skipped)
+    columns = {x: np.concatenate(parts[x]) if parts[x] else np.empty(0, dtype=np.float64 if x == "salary" else np.int32)
+               for x in parts}
+    columns["cities"] = list(city_codes)
+    columns["names"] = list(name_codes)
+    return columns
+
+
+def _exact_parts(values):
+    """ Раскладывает значения на степени двойки и куски мантисс по EXACT_PIECE бит для _exact_sums
+
+    :param values: Массив float
+    :return: tuple Наименьшая степень, массив степеней от неё и три массива кусков мантисс
+    """
+    np = _numpy()
+    mantissa, power = np.frexp(values)
+    mantissa = (mantissa * 2.0 ** 53).astype(np.int64)
+    low = int(power.min()) if len(power) else 0
+    mask = (1 << EXACT_PIECE) - 1
+    return (low, (power - low).astype(np.int64), (mantissa & mask).astype(np.float64),
+            ((mantissa >> EXACT_PIECE) & mask).astype(np.float64), (mantissa >> 2 * EXACT_PIECE).astype(np.float64))
+
+
+def _exact_sums(inverse, parts, size):
+    """ Точные суммы по группам, как сумма exact по строкам, но без цикла по строкам
+
+    Куски мантисс суммируются bincount по парам (группа, степень) и остаются целыми во float,
+    пока в группе меньше 2**35 строк, затем суммы собираются из кусков в int
+
+    :param inverse: Номера групп строк
+    :param parts: Разложение значений из _exact_parts
+    :param size: Кол-во групп
+    :return: list Точные суммы групп
+    """
+    np = _numpy()
+    low, power, *pieces = parts
+    span = int(power.max()) + 1 if len(power) else 1
+    bins = inverse * span + power
+    counts = np.bincount(bins, minlength=size * span)
+    pieces = [np.bincount(bins, weights=x, minlength=size * span).tolist() for x in pieces]
+    sums = [0] * size
+    for i in np.flatnonzero(counts).tolist():
+        group, power = divmod(i, span)
+        mantissa = int(pieces[0][i]) + (int(pieces[1][i]) << EXACT_PIECE) + (int(pieces[2][i]) << 2 * EXACT_PIECE)
+        sums[group] += mantissa << (low + power + EXACT_SCALE - 53)
+    return sums
+
+
+def _grouped_sums(keys, parts, names=None):
+    """ Точные суммы и кол-ва по группам в порядке первого появления ключа
+
+    :param keys: Массив ключей
+    :param parts: Разложение значений из _exact_parts
+    :param names: Расшифровка ключей, если ключи - коды
+    :return: tuple(dict, dict) Суммы и кол-ва по ключам
+    """
+    np = _numpy()
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = _exact_sums(inverse, parts, len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq)).tolist()
+    labels = uniq.tolist() if names is None else [names[x] for x in uniq.tolist()]
+    order = np.argsort(first, kind="stable").tolist()
+    return {labels[i]: sums[i] for i in order}, {labels[i]: counts[i] for i in order}
+
+
+def _grouped_sketches(keys, weights, names=None):
+    """ Скетчи квантилей значений по группам, каждая группа добавляется в свой скетч одним куском
+
+    :param keys: Массив ключей
+    :param weights: Массив значений
+    :param names: Расшифровка ключей, если ключи - коды
+    :return: dict QuantileSketch по ключам
+    """
+    np = _numpy()
+    order = np.argsort(keys, kind="stable")
+    uniq, starts = np.unique(keys[order], return_index=True)
+    values = weights[order]
+    bounds = [*starts.tolist(), len(values)]
+    return {(x if names is None else names[x]): QuantileSketch().update_many(values[bounds[i]:bounds[i + 1]])
+            for i, x in enumerate(uniq.tolist())}
+
+
+def columnar_partial(columns, name, period="year", quantiles=False):
+    """ Считает статистику группировками по столбцам
+
+    :param columns: Столбцы из load_columns
+    :param name: Имя профессии, None - не считать статистику по профессии
+    :param period: Период динамики из PERIODS
+    :param quantiles: Считать ли медиану и p10/p90 зп скетчами
+    :return: VacancyStats Статистика
+    """
+    np = _numpy()
+    with stage("columnar_partial", len(columns["salary"])):
+        is_prof = np.array([name is not None and name in x for x in columns["names"]], dtype=bool)
+        mask = is_prof[columns["name"]] if len(is_prof) else np.zeros(0, dtype=bool)
+        buckets, labels = period_buckets(columns, period)
+        stats = VacancyStats(name, period=period)
+        stats.number = len(columns["salary"])
+        parts = _exact_parts(columns["salary"])
+        stats.salary_all_years, stats.count_all_vacs = _grouped_sums(buckets, parts, labels)
+        if name is not None:
+            stats.salary_prof_years, stats.count_prof_vacs = _grouped_sums(
+                buckets[mask], (parts[0], *(x[mask] for x in parts[1:])), labels)
+        stats.salary_city, stats.count_city_vacs = _grouped_sums(columns["city"], parts, columns["cities"])
+        if quantiles:
+            stats.sketches = dict(year=_grouped_sketches(buckets, columns["salary"], labels),
+                                  year_prof=_grouped_sketches(buckets[mask], columns["salary"][mask], labels)
+                                  if name is not None else {},
+                                  city=_grouped_sketches(columns["city"], columns["salary"], columns["cities"]))
+    return stats
+
+
+def _load_chunk_columns(task):
+    """ Разбирает кусок файла в столбцы, выполняется в отдельном процессе
+
+    Если в файле есть лишние столбцы, кусок читается сканером mmap_rows, который не декодирует их байты
+
+    :param task: Кортеж (имя файла, начало, конец, ProfKeys, RateTable, нужен ли сканер)
+    :return: dict Столбцы куска
+    """
+    file_name, start, end, keys, rates, scan = task
+    if scan:
+        rows = mmap_rows(file_name, placeholders=True, start=start, end=end)
+        keys = ProfKeys(next(rows))
+    else:
+        rows = csv.reader(_chunk_lines(file_name, start, end))
+    return load_columns(rows, keys, rates=rates)
+
+
+def concat_columns(parts):
+    """ Склеивает столбцы кусков, перекодируя города и названия в общие коды
+
+    :param parts: Список столбцов в порядке следования данных
+    :return: dict Общие столбцы
+    """
+    np = _numpy()
+    city_codes, name_codes = {}, {}
+    columns = {x: [] for x in COLUMN_ARRAYS}
+    for part in parts:
+        for key in ("year", "day", "salary"):
+            columns[key].append(part[key])
+        for key, labels, codes in (("city", "cities", city_codes), ("name", "names", name_codes)):
+            remap = np.array([codes.setdefault(x, len(codes)) for x in part[labels]], dtype=np.int32)
+            columns[key].append(remap[part[key]] if len(remap) else part[key])
+    columns = {x: np.concatenate(columns[x]) if columns[x] else np.empty(0, dtype=np.float64 if x == "salary"
+                                                                            else np.int32) for x in columns}
+    columns["cities"] = list(city_codes)
+    columns["names"] = list(name_codes)
+    return columns
+
+
+def load_columns_parallel(file_name, processes=None, rates=None):
+    """ Разбирает csv файл в столбцы в нескольких процессах
+
+    :param file_name: Имя файла с расширением
+    :param processes: Кол-во процессов, по умолчанию по числу ядер
+    :param rates: RateTable, None - фиксированные курсы
+    :return: dict Столбцы в формате load_columns
+    """
+    import multiprocessing
+
+    processes = processes or os.cpu_count() or 1
+    header, chunks = split_file(file_name, processes * 4)
+    keys, scan = ProfKeys(header), bool(set(header) - set(ProfKeys.columns))
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(_load_chunk_columns, [(file_name, start, end, keys, rates, scan) for start, end in chunks])
+    return concat_columns(parts)
+
+
+def file_fingerprint(file_name):
+    """ Отпечаток файла по размеру, времени изменения и хэшу начала и конца файла
+
+    Хэшируются только первый и последний блоки, чтобы проверка кэша не читала весь файл
+
+    :param file_name: Имя файла с расширением
+    :return: str Отпечаток
+    """
+    stat = os.stat(file_name)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as file:
+        digest.update(file.read(FINGERPRINT_BLOCK))
+        if stat.st_size > FINGERPRINT_BLOCK:
+            file.seek(max(FINGERPRINT_BLOCK, stat.st_size - FINGERPRINT_BLOCK))
+            digest.update(file.read())
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{digest.hexdigest()}"
+
+
+def load_columns_cached(file_name, processes=None, rates=None):
+    """ Загружает столбцы из кэша рядом с csv файлом, пересобирая кэш при изменении файла или курсов
+
+    :param file_name: Имя файла с расширением
+    :param processes: Кол-во процессов для разбора больших файлов
+    :param rates: RateTable, None - фиксированные курсы
+    :return: dict Столбцы в формате load_columns, у пустого файла - пустые столбцы
+    """
+    np = _numpy()
+    cache_name = file_name + CACHE_SUFFIX
+    fingerprint = file_fingerprint(file_name) + ("" if rates is None else ":" + rates.fingerprint)
+    try:
+        with np.load(cache_name) as cache:
+            if cache["fingerprint"].item() == fingerprint:
+                with stage("load_columns_cache") as record:
+                    columns = {x: cache[x] for x in COLUMN_ARRAYS}
+                    for key in ("cities", "names"):
+                        columns[key] = _unpack_strings(cache[key], cache[f"{key}_ends"])
+                    record["rows"] = len(columns["year"])
+                return columns
+    except (OSError, KeyError, ValueError):
+        pass
+    if os.path.getsize(file_name) >= PARALLEL_MIN_SIZE:
+        columns = load_columns_parallel(file_name, processes, rates)
+    else:
+        header = csv_rows(file_name)
+        rows = mmap_rows(file_name, placeholders=True) if set(next(header, [])) - set(ProfKeys.columns) \
+            else csv_rows(file_name)
+        header.close()
+        columns = load_columns(rows, ProfKeys(next(rows, list(ProfKeys.columns))), rates=rates)
+    try:
+        with open(cache_name + ".tmp", 'wb') as file:
+            strings = {}
+            for key in ("cities", "names"):
+                strings[key], strings[f"{key}_ends"] = _pack_strings(columns[key])
+            np.savez(file, fingerprint=np.array(fingerprint), **strings, **{x: columns[x] for x in COLUMN_ARRAYS})
+        os.replace(cache_name + ".tmp", cache_name)
+    except OSError:
+        pass
+    return columns
+
+
+def create_dicts_columnar(columns, name):
+    """ Создаёт словари для заполнения Report класса по столбцам NumPy
+
+    :param columns: Столбцы из load_columns
+    :param name: Имя профессии
+    :return: int Общее число вакансий
+    """
+    return merge_partials([columnar_partial(columns, name)])
+
+
+def _scan_record(mm, pos):
+    """ Находит границы полей одной записи csv прямо в байтах файла, не копируя их
+
+    :param mm: mmap файла
+    :param pos: Позиция начала записи
+    :return: tuple(list, int) Список (начало, конец, в кавычках) полей и позиция следующей записи
+    """
+    fields = []
+    while True:
+        match = CSV_FIELD.match(mm, pos)
+        if match is None:
+            line_end = mm.find(b'\n', pos)
+            return [], len(mm) if line_end == -1 else line_end + 1
+        start, end = match.start(), match.start(1)
+        if end > start and mm[start] == 34:
+            fields.append((start + 1, end - 1, True))
+        else:
+            fields.append((start, end, False))
+        pos = match.end()
+        if match.end(1) - end != 1 or mm[end] != 44:
+            return fields, pos
+
+
+def mmap_rows(file_name, columns=ProfKeys.columns, placeholders=False, start=None, end=None):
+    """ Читает csv файл через mmap, декодируя только нужные столбцы
+
+    Остальные поля (например description и key_skills) только пропускаются по границам и не
+    превращаются в строки. Записи с пустыми полями, в том числе ненужными, отбрасываются так же,
+    как их отбрасывает all(line) в create_dicts.
+
+    :param file_name: Имя файла с расширением
+    :param columns: Заголовки нужных столбцов
+    :param placeholders: Вместо отброшенной записи отдавать [""], чтобы её учли как пропущенную
+    :param start: Начало куска записей из split_file, по умолчанию сразу после заголовка
+    :param end: Конец куска записей, по умолчанию конец файла
+    :return: generator Заголовки нужных столбцов, затем строки только из них в порядке файла
+    """
+    if os.path.getsize(file_name) == 0:
+        return
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = len(codecs.BOM_UTF8) if mm[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+        fields, pos = _scan_record(mm, pos)
+        header = [_decode_field(mm, field) for field in fields]
+        wanted = [i for i, x in enumerate(header) if x in columns]
+        yield [header[i] for i in wanted]
+        pos = pos if start is None else start
+        size = len(mm) if end is None else end
+        while pos < size:
+            fields, pos = _scan_record(mm, pos)
+            if len(fields) == len(header) and all(start < end for start, end, quoted in fields):
+                yield [_decode_field(mm, fields[i]) for i in wanted]
+            elif placeholders:
+                yield [""]
+
+
+def _decode_field(mm, field):
+    """ Декодирует поле записи csv
+
+    :param mm: mmap файла
+    :param field: Кортеж (начало, конец, в кавычках)
+    :return: str Значение поля
+    """
+    start, end, quoted = field
+    value = mm[start:end].decode('utf_8')
+    return value.replace('""', '"') if quoted else value
+
+
 def addToDict(key_val, dict, val):
     """ Считает колво вхождений значения в словарь
 
@@ -355,23 +2343,10 @@ def create_dicts(data, name):
     :param name: Имя профессии
     :return: int Общее число вакансий
     """
-    number = 0
-    for line in data:
-        if all(line):
-            number += 1
-            addToDict(year(line), salary_all_years,
-                      sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-            addToDict(line[Keys.area_name], salary_city,
-                      sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-            addToDict(year(line), count_all_vacs, 1)
-            addToDict(line[Keys.area_name], count_city_vacs, 1)
-            if name in line[Keys.name]:
-                addToDict(year(line), salary_prof_years,
-                          sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-                addToDict(year(line), count_prof_vacs, 1)
-    for_loop_div(count_all_vacs, salary_all_years, lambda x, y: int(x / y))
-    for_loop_div(count_prof_vacs, salary_prof_years, lambda x, y: int(x / y))
-    return number
+    with stage("create_dicts") as record:
+        stats = VacancyStats(name, Keys).update(data)
+        record.update(rows=stats.number + stats.skipped, skipped=stats.skipped)
+        return merge_partials([stats])
 
 
 def calculate_part_city(num):
@@ -379,44 +2354,189 @@ def calculate_part_city(num):
 
     :param num: Число всех вакансий
     """
-    for x in count_city_vacs.keys():
-        calc_num = Decimal(count_city_vacs[x] / num).quantize(Decimal("1.0000"))
-        if calc_num >= 0.01:
-            part_city[x] = calc_num.__float__()
-            salary_city_part[x] = int(salary_city[x] / count_city_vacs[x])
+    with stage("calculate_part_city", len(count_city_vacs)):
+        for x in count_city_vacs.keys():
+            calc_num = Decimal(count_city_vacs[x] / num).quantize(Decimal("1.0000"))
+            if calc_num >= 0.01:
+                part_city[x] = calc_num.__float__()
+                salary_city_part[x] = exact_mean(salary_city[x], count_city_vacs[x])
+
+
+def rank_key(item):
+    """ Ключ рейтинга: значение по убыванию, при равенстве имя по возрастанию
+
+    :param item: Пара (имя, значение)
+    :return: tuple Ключ сортировки
+    """
+    return -item[1], item[0]
+
+
+def rank(values: dict, top=None):
+    """ Рейтинг городов, лет или профессий одной сортировкой или кучей, если нужны только первые места
+
+    :param values: Словарь значений по именам
+    :param top: Кол-во первых мест, None - все
+    :return: list(tuple) Пары (имя, значение) по местам
+
+    >>> rank({'Пермь': 2, 'Киров': 1, 'Омск': 2})
+    [('Омск', 2), ('Пермь', 2), ('Киров', 1)]
+
+    >>> rank({2020: 5, 2021: 7, 2019: 7}, top=2)
+    [(2019, 7), (2021, 7)]
+    """
+    if top is None or top >= len(values):
+        return sorted(values.items(), key=rank_key)
+    return heapq.nsmallest(top, values.items(), key=rank_key)
 
 
 def alphabetic_sort(ls: list):
-    """ Сортирует список кортежей по алфавиту и по значению в обратном порядке
+    """ Сортирует список кортежей по значению в обратном порядке, а при равенстве по алфавиту
 
     :param ls: Список
     """
-    temp_list = []
-    for i in range(1, len(ls)):
-        if ls[i][1] == ls[i - 1][1]:
-            temp_list.append(ls[i])
-            if ls[i - 1] not in temp_list:
-                temp_list.append(ls[i - 1])
-        elif len(temp_list) > 1 and ls[i][1] != ls[i - 1][1]:
-            ls[ls.index(temp_list[0]) - 1:i] = sorted(temp_list, key=lambda f: f[0])
-            temp_list.clear()
+    ls.sort(key=rank_key)
+
+
+class ProfessionMatcher:
+    """ Ищет в строке сразу все названия профессий алгоритмом Ахо — Корасик
+
+    Attributes:
+        names (list(str)): Названия профессий без повторов, find возвращает индексы в этом списке
+    """
+
+    def __init__(self, names):
+        """ Строит автомат по названиям профессий
+
+        :param names: Список названий профессий
+
+        >>> ProfessionMatcher(['Python', 'Java', 'Py']).find('Python разработчик')
+        (0, 2)
+
+        >>> ProfessionMatcher(['Python', 'Java']).find('Аналитик')
+        ()
+        """
+        self.names = list(dict.fromkeys(names))
+        goto, out = [{}], [[]]
+        for i, name in enumerate(self.names):
+            state = 0
+            for ch in name:
+                if ch not in goto[state]:
+                    goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append([])
+                state = goto[state][ch]
+            out[state].append(i)
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        for state in queue:
+            out[state] += out[0]
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] += out[fail[nxt]]
+        self._goto, self._fail = goto, fail
+        self._out = [tuple(sorted(set(x))) for x in out]
+
+    def find(self, text):
+        """ Находит профессии, названия которых входят в строку
+
+        :param text: Строка
+        :return: tuple(int) Индексы найденных профессий по возрастанию
+        """
+        found = set(self._out[0])
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            found.update(self._out[state])
+        return tuple(sorted(found))
+
+
+def batch_partials(columns, names, period="year", quantiles=False):
+    """ Считает частичные результаты сразу для нескольких профессий за один проход по столбцам
+
+    Каждая строка повторяется для каждой найденной в её названии профессии, после чего точные суммы по
+    парам (профессия, год) считаются одним проходом и совпадают с create_dicts. Скетчи по годам и городам
+    общие для всех профессий и копируются, скетчи профессий строятся по тем же парам
+
+    :param columns: Столбцы из load_columns
+    :param names: Список названий профессий
+    :param period: Период динамики из PERIODS
+    :param quantiles: Считать ли медиану и p10/p90 зп скетчами
+    :return: dict VacancyStats для каждой профессии
+    """
+    np = _numpy()
+    matcher = ProfessionMatcher(names)
+    common = columnar_partial(columns, None, period, quantiles)
+    sketches, common.sketches = common.sketches, None
+    buckets, labels = period_buckets(columns, period)
+    matches = [matcher.find(x) for x in columns["names"]]
+    match_count = np.array([len(x) for x in matches], dtype=np.int64)
+    match_start = np.concatenate(([0], np.cumsum(match_count)[:-1])).astype(np.int64)
+    flat = np.fromiter(itertools.chain.from_iterable(matches), dtype=np.int64, count=int(match_count.sum()))
+    repeat = match_count[columns["name"]] if len(match_count) else np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(len(repeat)), repeat)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+    profs = flat[match_start[columns["name"][rows]] + within]
+    years, year_idx = np.unique(buckets, return_inverse=True)
+    uniq, first, inverse = np.unique(profs * len(years) + year_idx.reshape(-1)[rows], return_index=True,
+                                     return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = _exact_sums(inverse, _exact_parts(columns["salary"][rows]), len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq)).tolist()
+    years = years.tolist() if labels is None else [labels[x] for x in years.tolist()]
+    result = {x: VacancyStats(x, period=period).merge(common) for x in matcher.names}
+    for i in np.argsort(first, kind="stable").tolist():
+        prof, year_code = divmod(uniq[i].item(), len(years))
+        stats = result[matcher.names[prof]]
+        stats.salary_prof_years[years[year_code]] = sums[i]
+        stats.count_prof_vacs[years[year_code]] = counts[i]
+    if quantiles:
+        for stats in result.values():
+            stats.sketches = dict(year=copy.deepcopy(sketches["year"]), year_prof={},
+                                  city=copy.deepcopy(sketches["city"]))
+        for i, sketch in _grouped_sketches(inverse, columns["salary"][rows]).items():
+            prof, year_code = divmod(uniq[i].item(), len(years))
+            result[matcher.names[prof]].sketches["year_prof"][years[year_code]] = sketch
+    return result
+
+
+def batch_reports(columns, names, top=10, period="year", quantiles=False):
+    """ Строит по отчёту на каждую профессию за один проход по данным
+
+    :param columns: Столбцы из load_columns
+    :param names: Список названий профессий
+    :param top: Кол-во городов в рейтингах
+    :param period: Период динамики из PERIODS
+    :param quantiles: Считать ли медиану и p10/p90 зп скетчами
+    :return: dict Отчёты по названиям профессий
+    """
+    return {x: stats.report(top) for x, stats in batch_partials(columns, names, period, quantiles).items()}
+
+
+def rank_professions(columns, names, top=10):
+    """ Рейтинг профессий по кол-ву вакансий за один проход по данным
+
+    :param columns: Столбцы из load_columns
+    :param names: Список названий профессий
+    :param top: Кол-во первых мест
+    :return: list(tuple) Пары (профессия, кол-во вакансий)
+    """
+    return rank({x: sum(stats.count_prof_vacs.values()) for x, stats in batch_partials(columns, names).items()}, top)
 
 
 if __name__ == '__main__':
-    file_name = input("Введите название файла: ")
-    prof_name = input("Введите название профессии: ")
-
-    data = csv_reader(file_name)
-    Keys = ProfKeys(data.pop(0))
-    number_of_vacs = create_dicts(data, prof_name)
-    calculate_part_city(number_of_vacs)
-    city_part_vacs = sorted(part_city.items(), key=lambda x: x[1], reverse=True)
-    city_salary = sorted(salary_city_part.items(), key=lambda x: x[1], reverse=True)
-    alphabetic_sort(city_salary)
-    fill(salary_prof_years, salary_all_years, 0)
-    fill(count_prof_vacs, count_all_vacs, 0)
-    report = Report(salary_all_years, count_all_vacs, salary_prof_years, count_prof_vacs, dict(city_salary[0:10]),
-                    dict(city_part_vacs[0:10]))
+    file_name = sys.argv[1] if len(sys.argv) > 1 else input("Введите название файла: ")
+    prof_name = sys.argv[2] if len(sys.argv) > 2 else input("Введите название профессии: ")
+    rates = load_rates(sys.argv[3] if len(sys.argv) > 3 else None)
+
+    report = columnar_partial(load_columns_cached(file_name, rates=rates), prof_name).report()
     report.print_data()
     report.generate_image()
 else:
@@ -1,6 +1,29 @@
 from unittest import TestCase
-from task2 import addToDict, sal, Keys, year, fill_gaps, ProfKeys
+import task2
+from task2 import addToDict, sal, Keys, year, fill_gaps, ProfKeys, csv_reader, csv_rows, split_file, \
+    create_dicts, create_dicts_parallel, load_columns, create_dicts_columnar, \
+    load_columns_cached, CACHE_SUFFIX, mmap_rows, ProfessionMatcher, batch_reports, columnar_partial, VacancyStats, \
+    update_stats, STATE_SUFFIX, QuantileSketch, RateTable, period_key, period_buckets, PERIODS, stage, STATS_ENV, \
+    PROFILE_ENV, PROFILE_DIR_ENV, rank, alphabetic_sort, rank_professions, load_index, profession_stats, \
+    INDEX_SUFFIX, render_reports
+import asyncio
+import copy
+import datetime
+import json
+import os
 import random as rd
+import subprocess
+import sys
+import tempfile
+from contextlib import chdir, redirect_stderr, redirect_stdout
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+import openpyxl
+
+import wtf
+import bench
+import service
 
 list1 = ['name', 'salary_from', 'salary_to', 'salary_currency', 'area_name', 'published_at']
 
@@ -70,3 +93,920 @@ class ProfKeysTest(TestCase):
 
     def test_area_name_with_junk_item(self):
         self.assertEqual(pk2.area_name, 5)
+
+
+class CsvRowsTest(TestCase):
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,salary_from,description\r\nPython,100,"a\r\nb"\r\nJava,,c\r\n')
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def test_is_lazy(self):
+        rows = csv_rows(self.file_name)
+        self.assertEqual(next(rows), ['name', 'salary_from', 'description'])
+        rows.close()
+
+    def test_same_as_csv_reader(self):
+        self.assertEqual(list(csv_rows(self.file_name)), csv_reader(self.file_name))
+
+
+class CreateDictsParallelTest(TestCase):
+    names = ['salary_all_years', 'count_all_vacs', 'salary_prof_years', 'count_prof_vacs', 'salary_city',
+             'count_city_vacs']
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        rd.seed(5)
+        with os.fdopen(fd, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,description,salary_from,salary_to,salary_currency,area_name,published_at\r\n')
+            for i in range(300):
+                file.write(f'{rd.choice(["Python dev", "Java dev"])},"line\r\n""{i}""",{rd.randint(1, 9) * 1000},'
+                           f'{rd.randint(10, 20) * 1000},{rd.choice(["RUR", "USD"])},{rd.choice(["A", "B", "C"])},'
+                           f'{rd.randint(2007, 2012)}-01-01T00:00:00+0300\r\n')
+
+    def tearDown(self):
+        os.remove(self.file_name)
+        self._take()
+        task2.Keys = Keys
+
+    def _take(self):
+        result = {x: list(getattr(task2, x).items()) for x in self.names}
+        for x in self.names:
+            getattr(task2, x).clear()
+        return result
+
+    def test_chunks_cover_file(self):
+        header, chunks = split_file(self.file_name, 7)
+        self.assertEqual(header[0], 'name')
+        self.assertEqual(chunks[-1][1], os.path.getsize(self.file_name))
+        self.assertTrue(all(a[1] == b[0] for a, b in zip(chunks, chunks[1:])))
+
+    def test_same_as_serial(self):
+        rows = csv_rows(self.file_name)
+        task2.Keys = ProfKeys(next(rows))
+        serial_number = create_dicts(rows, 'Python')
+        serial = self._take()
+        self.assertEqual(create_dicts_parallel(self.file_name, 'Python', 3), serial_number)
+        self.assertEqual(self._take(), serial)
+
+    def test_sums_do_not_depend_on_order(self):
+        with open(self.file_name, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,salary_from,salary_to,salary_currency,area_name,published_at\r\n')
+            file.write(f'Python,{2 ** 53},{2 ** 53},RUR,A,2007-01-01T00:00:00+0300\r\n')
+            file.write('Python,1,1,RUR,A,2007-01-01T00:00:00+0300\r\n' * 299)
+        expected = (2 ** 53 + 299) // 300
+        rows = csv_rows(self.file_name)
+        task2.Keys = ProfKeys(next(rows))
+        create_dicts(rows, 'Python')
+        self.assertEqual(self._take()['salary_all_years'], [(2007, expected)])
+        create_dicts_parallel(self.file_name, 'Python', 3)
+        self.assertEqual(self._take()['salary_all_years'], [(2007, expected)])
+        rows = csv_rows(self.file_name)
+        report = columnar_partial(load_columns(rows, ProfKeys(next(rows))), 'Python').report()
+        self.assertEqual((report.year_sal_l, report.year_prof_sal_l, report.sal_A_l),
+                         ([expected], [expected], [expected]))
+
+    def test_columnar_same_as_serial(self):
+        rows = csv_rows(self.file_name)
+        task2.Keys = ProfKeys(next(rows))
+        serial_number = create_dicts(rows, 'Python')
+        serial = self._take()
+        rows = csv_rows(self.file_name)
+        columns = load_columns(rows, ProfKeys(next(rows)), batch_size=7)
+        self.assertEqual(create_dicts_columnar(columns, 'Python'), serial_number)
+        self.assertEqual(self._take(), serial)
+
+    def test_batch_same_as_single(self):
+        rows = csv_rows(self.file_name)
+        columns = load_columns(rows, ProfKeys(next(rows)))
+        names = ['Python', 'dev', 'Java dev', 'Go']
+        for quantiles in (False, True):
+            reports = batch_reports(columns, names, quantiles=quantiles)
+            for name in names:
+                single = columnar_partial(columns, name, quantiles=quantiles).report()
+                self.assertEqual(vars(reports[name]), vars(single))
+
+    def test_rank_professions(self):
+        rows = csv_rows(self.file_name)
+        columns = load_columns(rows, ProfKeys(next(rows)))
+        reports = batch_reports(columns, ['Python', 'dev', 'Go'])
+        expected = sorted(((x, sum(reports[x].year_prof_vacs.values())) for x in reports),
+                          key=lambda x: (-x[1], x[0]))
+        self.assertEqual(rank_professions(columns, ['Python', 'dev', 'Go'], 2), expected[:2])
+
+
+class ColumnsCacheTest(TestCase):
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,salary_from,salary_to,salary_currency,area_name,published_at\r\n'
+                       'Python,100,300,RUR,A,2007-01-01T00:00:00+0300\r\n')
+
+    def tearDown(self):
+        for name in (self.file_name, self.file_name + CACHE_SUFFIX):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_writes_and_reuses_cache(self):
+        columns = load_columns_cached(self.file_name)
+        self.assertTrue(os.path.exists(self.file_name + CACHE_SUFFIX))
+        cached = load_columns_cached(self.file_name)
+        self.assertEqual(cached['salary'].tolist(), [200.0])
+        self.assertEqual(cached['cities'], columns['cities'])
+
+    def test_rebuilds_on_change(self):
+        load_columns_cached(self.file_name)
+        with open(self.file_name, 'a', encoding='utf_8', newline='') as file:
+            file.write('Java,1,1,USD,B,2008-01-01T00:00:00+0300\r\n')
+        columns = load_columns_cached(self.file_name)
+        self.assertEqual(columns['year'].tolist(), [2007, 2008])
+        self.assertEqual(columns['names'], ['Python', 'Java'])
+
+    def test_cache_size_follows_csv(self):
+        with open(self.file_name, 'a', encoding='utf_8', newline='') as file:
+            file.write('Программист ' + 'x' * 2000 + ',1,1,RUR,A,2007-01-01T00:00:00+0300\r\n')
+            for i in range(2000):
+                file.write(f'Вакансия {i},1,1,RUR,Город {i},2007-01-01T00:00:00+0300\r\n')
+        columns = load_columns_cached(self.file_name)
+        self.assertLess(os.path.getsize(self.file_name + CACHE_SUFFIX), 2 * os.path.getsize(self.file_name))
+        self.assertEqual(load_columns_cached(self.file_name)['names'], columns['names'])
+        self.assertEqual(columns['names'][2], 'Вакансия 0')
+
+
+class MmapRowsTest(TestCase):
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,description,salary_from\r\n"a ""b""",x,1\r\n"q","multi\r\nline, ""x""",2\r\n'
+                       'z,,3\r\nlast,y,4')
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def test_only_needed_columns(self):
+        self.assertEqual(list(mmap_rows(self.file_name, ('name', 'salary_from'))),
+                         [['name', 'salary_from'], ['a "b"', '1'], ['q', '2'], ['last', '4']])
+
+    def test_same_as_csv_rows(self):
+        rows = [line for line in csv_rows(self.file_name) if all(line)]
+        self.assertEqual(list(mmap_rows(self.file_name, ('name', 'description', 'salary_from'))), rows)
+
+    def test_chunks_same_as_whole_file(self):
+        header, chunks = split_file(self.file_name, 3)
+        rows = [line for start, end in chunks for line in list(mmap_rows(self.file_name, start=start, end=end))[1:]]
+        self.assertEqual(rows, list(mmap_rows(self.file_name))[1:])
+
+
+class ProfessionMatcherTest(TestCase):
+
+    def test_same_as_in(self):
+        names = ['he', 'she', 'his', 'hers', 'Python', 'e']
+        matcher = ProfessionMatcher(names)
+        for text in ['ushers', 'Python dev', 'this', 'x', '']:
+            self.assertEqual(matcher.find(text), tuple(i for i, x in enumerate(names) if x in text))
+
+    def test_empty_name_matches_everything(self):
+        self.assertEqual(ProfessionMatcher(['', 'a']).find('b'), (0,))
+
+
+class VacancyStatsTest(TestCase):
+    rows = [['Python dev', '100', '300', 'RUR', 'A', '2007-01-01'],
+            ['Java dev', '10', '30', 'USD', 'B', '2008-01-01'],
+            ['Python', '', '30', 'USD', 'B', '2008-01-01'],
+            ['Python', '50', '70', 'RUR', 'B', '2008-01-01']]
+
+    def test_merge_same_as_update(self):
+        whole = VacancyStats('Python', pk1).update(self.rows)
+        merged = VacancyStats('Python', pk1).update(self.rows[:2])
+        merged.merge(VacancyStats('Python', pk1).update(self.rows[2:]))
+        self.assertEqual(vars(merged), vars(whole))
+
+    def test_instances_do_not_share_state(self):
+        first = VacancyStats('Python', pk1).update(self.rows)
+        second = VacancyStats('Java', pk1).update(self.rows[:2])
+        self.assertEqual(first.count_prof_vacs, {2007: 1, 2008: 1})
+        self.assertEqual(second.count_prof_vacs, {2008: 1})
+        self.assertEqual(task2.count_all_vacs, {})
+
+    def test_report(self):
+        report = VacancyStats('Python', pk1).update(self.rows).report()
+        self.assertEqual(report.year_prof_sal, {2007: 200, 2008: 60})
+        self.assertEqual(report.city_B_l, ['B', 'A'])
+
+
+class VacancyRecordTest(TestCase):
+
+    def test_fields_parsed_once(self):
+        header = PagedVacanciesTest.header + ['extra']
+        rows = [[''.join(list(x)) for x in line] + ['x'] for line in VacancyQueryTest.rows] + [VacancyQueryTest.rows[0]]
+        shared = {}
+        records = list(task2.Vacancy.records(iter(rows), header, shared=shared))
+        self.assertEqual(len(records), 3)
+        first, second = records[:2]
+        self.assertEqual((first.salary_from, first.salary_to, first.premium, second.premium, first.salary_gross),
+                         (1000.0, 2000.0, True, False, True))
+        self.assertIs(first.area_name, second.area_name)
+        again, = task2.Vacancy.records(iter(rows[:1]), header, shared=shared)
+        self.assertIs(first.published_at, again.published_at)
+        self.assertEqual(sorted(shared), ['area_name', 'experience_id', 'published_at', 'salary_currency'])
+        self.assertEqual(datetime.date.fromordinal(first.published_at), datetime.date(2022, 7, 5))
+        self.assertEqual(first.key_skills, 'Python\nSQL')
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertEqual(first.other, {'extra': 'x'})
+        with self.assertRaises(AttributeError):
+            first.extra
+
+    def test_missing_fields_are_none(self):
+        record, = task2.Vacancy.records([VacancyStatsTest.rows[0]], list1)
+        self.assertEqual((record.name, record.description, record.premium), ('Python dev', None, None))
+
+    def test_numbers_cleaned_before_parsing(self):
+        line = ['Python dev', '<b>1000</b>', ' 2000 ', 'RUR', 'A', '2007-01-01']
+        record, = wtf.csv_filter_rows([line], list1)
+        self.assertEqual((record.salary_from, record.salary_to), (1000.0, 2000.0))
+
+
+class UpdateStatsTest(TestCase):
+    header = 'name,salary_from,salary_to,salary_currency,area_name,published_at\r\n'
+    rows = ['Python,100,300,RUR,A,2007-01-01\r\n', 'Java,10,30,USD,B,2008-01-01\r\n',
+            '"Python\r\ndev",50,70,RUR,B,2008-01-01\r\n']
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+    def tearDown(self):
+        for name in (self.file_name, self.file_name + STATE_SUFFIX):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def _write(self, text, mode='a'):
+        with open(self.file_name, mode, encoding='utf_8', newline='') as file:
+            file.write(text)
+
+    def test_reads_appended_tail(self):
+        self._write(self.header + self.rows[0], 'w')
+        self.assertEqual(update_stats(self.file_name, 'Python').number, 1)
+        self._write(self.rows[1] + self.rows[2][:12])
+        self.assertEqual(update_stats(self.file_name, 'Python').count_all_vacs, {2007: 1, 2008: 1})
+        self._write(self.rows[2][12:])
+        stats = update_stats(self.file_name, 'Python')
+        self.assertEqual(stats.count_prof_vacs, {2007: 1, 2008: 1})
+        self.assertEqual(update_stats(self.file_name, 'Java').count_prof_vacs, {2008: 1})
+
+    def test_last_row_without_newline(self):
+        self._write(self.header + self.rows[0] + self.rows[1].rstrip(), 'w')
+        self.assertEqual(update_stats(self.file_name, 'Python').count_all_vacs, {2007: 1, 2008: 1})
+        self._write('\r\n' + self.rows[2])
+        self.assertEqual(update_stats(self.file_name, 'Python').count_all_vacs, {2007: 1, 2008: 2})
+
+    def test_rebuilds_after_rewrite(self):
+        self._write(self.header + ''.join(self.rows), 'w')
+        self.assertEqual(update_stats(self.file_name, 'Python').number, 3)
+        self._write(self.header + self.rows[1], 'w')
+        self.assertEqual(update_stats(self.file_name, 'Python').number, 1)
+
+    def test_rebuilds_on_broken_state(self):
+        self._write(self.header + ''.join(self.rows), 'w')
+        for text in ('[1, 2]', '{"offset": "x"}', 'not json', '\x80'):
+            with open(self.file_name + STATE_SUFFIX, 'w', encoding='latin_1') as file:
+                file.write(text)
+            self.assertEqual(update_stats(self.file_name, 'Python').count_prof_vacs, {2007: 1, 2008: 1})
+
+    def test_keeps_rates_period_and_quantiles(self):
+        self._write(self.header + self.rows[0], 'w')
+        update_stats(self.file_name, 'Python')
+        self._write(''.join(self.rows[1:]))
+        rates = RateTable({'2008-01': {'USD': 2.0}})
+        stats = update_stats(self.file_name, 'Python', rates, 'month', True)
+        rows = csv_rows(self.file_name)
+        expected = VacancyStats('Python', ProfKeys(next(rows)), rates, 'month', True).update(rows).report()
+        self.assertEqual(vars(stats.report()), vars(expected))
+        self.assertEqual(vars(update_stats(self.file_name, 'Python', rates, 'month', True).report()), vars(expected))
+        self.assertIsNone(update_stats(self.file_name, 'Python', rates, 'month').sketches)
+
+
+class GenerateExcelTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.report = VacancyStats('Python', pk1).update(VacancyStatsTest.rows).report()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_write_only_same_as_normal(self):
+        self.assertSameWorkbooks(self.report, 2, 5)
+
+    def test_quantile_columns(self):
+        report = VacancyStats('Python', pk1, quantiles=True).update(VacancyStatsTest.rows).report()
+        self.assertSameWorkbooks(report, 3, 11)
+        sheets = openpyxl.load_workbook(os.path.join(self.dir.name, 'a.xlsx')).worksheets
+        self.assertEqual([x.value for x in sheets[0][1]][5:8], ['p10', 'Медиана', 'p90'])
+        self.assertEqual([x.value for x in sheets[2][1]], ['Город', 'p10', 'Медиана', 'p90'])
+
+    def assertSameWorkbooks(self, report, sheet_count, max_col):
+        normal, streamed = os.path.join(self.dir.name, 'a.xlsx'), os.path.join(self.dir.name, 'b.xlsx')
+        report.generate_excel(normal)
+        report.generate_excel(streamed, write_only=True)
+        normal, streamed = openpyxl.load_workbook(normal).worksheets, openpyxl.load_workbook(streamed).worksheets
+        self.assertEqual((len(normal), len(streamed)), (sheet_count, sheet_count))
+        for a, b in zip(normal, streamed):
+            self.assertEqual(a.title, b.title)
+            for row in a.iter_rows(max_col=max_col, max_row=max(a.max_row, b.max_row)):
+                for cell in row:
+                    other = b[cell.coordinate]
+                    self.assertEqual((cell.value, cell.font.b, cell.number_format, cell.border.left.style),
+                                     (other.value, other.font.b, other.number_format, other.border.left.style))
+            for col in range(1, a.max_column + 1):
+                letter = openpyxl.utils.get_column_letter(col)
+                self.assertEqual(a.column_dimensions[letter].width, b.column_dimensions[letter].width)
+
+
+class RenderReportsTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.reports = [VacancyStats(name, pk1).update(VacancyStatsTest.rows).report() for name in ('Python', 'Java')]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_generate_image_keeps_report(self):
+        report = self.reports[0]
+        before = copy.deepcopy(vars(report))
+        report.generate_image(os.path.join(self.dir.name, 'a.png'))
+        report.generate_image(os.path.join(self.dir.name, 'b.png'))
+        self.assertEqual(vars(report), before)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.reports[0].snapshot()
+        self.assertEqual(list(snapshot.city_B_l), self.reports[0].city_B_l)
+        with self.assertRaises(AttributeError):
+            snapshot.city_B_l.append('Москва')
+
+    def test_render_reports(self):
+        image, excel = os.path.join(self.dir.name, '{name}.png'), os.path.join(self.dir.name, '{i}.xlsx')
+        names = render_reports(self.reports, image, excel, processes=2)
+        self.assertEqual(names, [(os.path.join(self.dir.name, 'Python.png'), os.path.join(self.dir.name, '0.xlsx')),
+                                 (os.path.join(self.dir.name, 'Java.png'), os.path.join(self.dir.name, '1.xlsx'))])
+        for pair in names:
+            self.assertTrue(all(os.path.getsize(x) for x in pair))
+        self.assertEqual(openpyxl.load_workbook(names[1][1]).worksheets[0]['C1'].value, 'Средняя зарплата - Java')
+
+    def test_same_file_names(self):
+        with self.assertRaises(ValueError):
+            render_reports(self.reports, os.path.join(self.dir.name, 'graph.png'), None)
+
+
+class ChartRendererTest(TestCase):
+
+    def test_reused_figure_same_as_new(self):
+        reports = [VacancyStats(name, pk1, quantiles=True).update(VacancyStatsTest.rows).report()
+                   for name in ('Python', 'Java')]
+        renderer = task2.ChartRenderer()
+        for report in reports:
+            reused, new = BytesIO(), BytesIO()
+            renderer.render(report, reused)
+            task2.ChartRenderer().render(report, new)
+            self.assertEqual(reused.getvalue(), new.getvalue())
+        self.assertEqual(len(renderer.figure.axes), 4)
+
+    def test_format_and_dpi(self):
+        report = VacancyStats('Python', pk1).update(VacancyStatsTest.rows).report()
+        svg, png = BytesIO(), BytesIO()
+        task2.ChartRenderer(format='svg').render(report, svg)
+        task2.ChartRenderer(dpi=50, format='png').render(report, png)
+        self.assertIn(b'<svg', svg.getvalue()[:1000])
+        self.assertEqual(png.getvalue()[16:24], (320).to_bytes(4, 'big') + (240).to_bytes(4, 'big'))
+
+
+class ServiceTest(TestCase):
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write('name,salary_from,salary_to,salary_currency,area_name,published_at\r\n')
+            for i in range(40):
+                file.write(f'{["Python dev", "Java dev"][i % 2]},{i * 1000},{i * 2000},RUR,{"AB"[i % 3 // 2]},'
+                           f'{2010 + i % 4}-0{1 + i % 9}-01T00:00:00+0300\r\n')
+        self.service = service.StatsService(self.file_name, processes=1, cache_size=2)
+
+    def tearDown(self):
+        self.service.close()
+        os.remove(self.file_name)
+        os.remove(self.file_name + CACHE_SUFFIX)
+        os.remove(self.file_name + INDEX_SUFFIX)
+
+    def requests(self, *targets):
+        async def get(port, target):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            status = int((await reader.readline()).split()[1])
+            body = (await reader.read()).split(b'\r\n\r\n', 1)[1]
+            writer.close()
+            return status, json.loads(body)
+
+        async def run():
+            server = await asyncio.start_server(self.service.handle, '127.0.0.1', 0)
+            async with server:
+                port = server.sockets[0].getsockname()[1]
+                return await asyncio.gather(*[get(port, x) for x in targets])
+
+        return asyncio.run(run())
+
+    def test_profession(self):
+        (status, body), = self.requests('/profession?name=Python&period=quarter&quantiles=1')
+        expected = columnar_partial(load_columns_cached(self.file_name), 'Python', 'quarter', True).report()
+        self.assertEqual(status, 200)
+        self.assertEqual(body['years']['periods'], expected.years_l)
+        self.assertEqual(body['profession_years']['vacancies'], expected.year_prof_vacs_l)
+        self.assertEqual(body['cities']['salary']['quantiles'], [list(x) for x in expected.city_q_l])
+
+    def test_same_requests_share_cache(self):
+        results = self.requests('/years', '/years', '/cities')
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[2][1]['share']['cities'], ['A', 'B'])
+        self.assertEqual(list(self.service.cache), [('', 'year', False)])
+
+    def test_lru_eviction(self):
+        self.requests('/profession?name=Python', '/profession?name=Java', '/years')
+        self.requests('/profession?name=Python')
+        self.assertEqual(list(self.service.cache), [('', 'year', False), ('Python', 'year', False)])
+
+    def test_errors(self):
+        statuses = [x[0] for x in self.requests('/profession', '/years?period=day', '/nope', '/years?quantiles=yes',
+                                                '/profession?name=Ruby')]
+        self.assertEqual(statuses, [400, 400, 404, 400, 404])
+        self.assertEqual(list(self.service.cache), [])
+
+    def test_quantiles_flag(self):
+        self.requests('/years?quantiles=false', '/years?quantiles=True')
+        self.assertCountEqual(self.service.cache, [('', 'year', False), ('', 'year', True)])
+
+
+class CliTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.dir.name, 'vacancies.csv')
+        with open(self.file_name, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write(','.join(PagedVacanciesTest.header) + '\r\n')
+            file.write('\r\n'.join(','.join(f'"{x}"' for x in row) for row in VacancyQueryTest.rows))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_main(self, *argv):
+        out = StringIO()
+        with redirect_stdout(out):
+            wtf.main(list(argv))
+        return out.getvalue()
+
+    def test_stats_engines_match_interactive(self):
+        out = StringIO()
+        with redirect_stdout(out):
+            columnar_partial(load_columns_cached(self.file_name), 'Python').report().print_data()
+        excel = os.path.join(self.dir.name, 'report.xlsx')
+        for engine in ('columnar', 'parallel', 'index', 'incremental'):
+            self.assertEqual(self.run_main('stats', self.file_name, 'Python', '--engine', engine, '--rates', '',
+                                           '--image', '', '--excel', excel, '--processes', '2'), out.getvalue())
+        self.assertEqual(openpyxl.load_workbook(excel).worksheets[0]['C1'].value, 'Средняя зарплата - Python')
+
+    def test_unsupported_option(self):
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            wtf.main(['stats', self.file_name, 'Python', '--engine', 'index', '--quantiles'])
+        rates = os.path.join(self.dir.name, 'rates.csv')
+        with open(rates, 'w', encoding='utf_8') as file:
+            file.write('date,USD\n2022-07,60\n')
+        self.assertEqual(*[self.run_main('stats', self.file_name, 'Python', '--engine', x, '--rates', rates,
+                                         '--image', '') for x in ('incremental', 'columnar')])
+
+    def test_vacancies_query(self):
+        out = self.run_main('vacancies', self.file_name, '--skill', 'SQL', '--name', 'dev', '--index',
+                            '--sort', 'salary', '--reverse')
+        self.assertLess(out.index('Python dev'), out.index('Java dev'))
+        self.assertNotIn('Python lead', out)
+        self.assertEqual(self.run_main('vacancies', self.file_name, '--area', 'Омск'), 'Нет данных\n')
+
+    def test_jobs_parse_file_once(self):
+        jobs_file = os.path.join(self.dir.name, 'jobs.csv')
+        with open(jobs_file, 'w', encoding='utf_8', newline='') as file:
+            file.write('file,profession,excel,period,quantiles\n')
+            for i, (name, period, quantiles) in enumerate([('Python', '', ''), ('Java', 'month', ''),
+                                                            ('Python', '', '1')]):
+                file.write(f'{self.file_name},{name},{os.path.join(self.dir.name, f"{i}.xlsx")},{period},{quantiles}\n')
+        with patch('wtf.load_columns_cached', wraps=load_columns_cached) as load:
+            out = self.run_main('jobs', jobs_file, '--processes', '1')
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(len(out.splitlines()), 3)
+        sheets = [openpyxl.load_workbook(os.path.join(self.dir.name, f'{i}.xlsx')).worksheets for i in range(3)]
+        self.assertEqual([x[0].title for x in sheets], ['Статистика по годам', 'Статистика по месяцам',
+                                                        'Статистика по годам'])
+        self.assertEqual([len(x) for x in sheets], [2, 2, 3])
+
+    def test_jobs_errors(self):
+        jobs_file = os.path.join(self.dir.name, 'jobs.csv')
+        for rows in (['nope.csv,Python,a.xlsx'], [f'{self.file_name},Python,a.xlsx', f'{self.file_name},Java,a.xlsx']):
+            with open(jobs_file, 'w', encoding='utf_8') as file:
+                file.write('\n'.join(['file,profession,excel'] + rows))
+            with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+                wtf.main(['jobs', jobs_file])
+
+    def test_input_errors(self):
+        missing = os.path.join(self.dir.name, 'nope.csv')
+        for argv in (['stats', missing, 'Python'], ['stats', missing, 'Python', '--engine', 'index'],
+                     ['vacancies', missing]):
+            with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+                wtf.main(argv)
+
+    def test_jobs_on_empty_file(self):
+        empty, jobs_file = os.path.join(self.dir.name, 'empty.csv'), os.path.join(self.dir.name, 'jobs.csv')
+        open(empty, 'w').close()
+        with open(jobs_file, 'w', encoding='utf_8') as file:
+            file.write(f'file,profession\n{empty},Python\n')
+        self.assertEqual(self.run_main('jobs', jobs_file, '--processes', '1'), f'{empty}: Python -> -\n')
+
+    def test_jobs_quantiles_flag(self):
+        jobs_file = os.path.join(self.dir.name, 'jobs.csv')
+        for value, expected in (('false', False), ('TRUE', True), ('', False), ('no', None)):
+            with open(jobs_file, 'w', encoding='utf_8') as file:
+                file.write(f'file,profession,quantiles\n{self.file_name},Python,{value}\n')
+            if expected is None:
+                with self.assertRaisesRegex(ValueError, 'quantiles'):
+                    wtf.read_jobs(jobs_file)
+            else:
+                self.assertEqual(wtf.read_jobs(jobs_file)[0]['quantiles'], expected)
+
+    def test_jobs_without_columns(self):
+        jobs_file = os.path.join(self.dir.name, 'jobs.csv')
+        with open(jobs_file, 'w', encoding='utf_8') as file:
+            file.write('file,excel\n')
+        with self.assertRaisesRegex(ValueError, 'profession'):
+            wtf.read_jobs(jobs_file)
+
+
+class LazyImportTest(TestCase):
+
+    def test_import_does_not_load_heavy_modules(self):
+        code = "import sys, task2; print(*[x for x in ('numpy', 'matplotlib', 'openpyxl') if x in sys.modules])"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class PagedVacanciesTest(TestCase):
+    header = ['name', 'description', 'key_skills', 'experience_id', 'premium', 'employer_name', 'salary_from',
+              'salary_to', 'salary_gross', 'salary_currency', 'area_name', 'published_at']
+
+    def rows(self, count):
+        for i in range(count):
+            yield [f'Vacancy {i}', '<p>Text</p>', 'Python\nSQL', 'noExperience', 'False', 'Firm', '100', '200',
+                   'True', 'RUR', 'Москва', '2022-07-05T18:19:30+0300']
+        raise AssertionError('read past the requested rows')
+
+    def test_reads_only_requested_rows(self):
+        out = StringIO()
+        with redirect_stdout(out):
+            printed = wtf.print_vacancies_paged(wtf.csv_filter_rows(self.rows(5), self.header), wtf.replacement_dic,
+                                                page_size=2, offset=1, limit=3)
+        self.assertEqual(printed, 3)
+        self.assertEqual(out.getvalue().count('| №'), 2)
+        self.assertIn('| 4 ', out.getvalue())
+        self.assertNotIn('| 5 ', out.getvalue())
+
+    def test_empty(self):
+        self.assertEqual(wtf.print_vacancies_paged(iter([]), wtf.replacement_dic), 0)
+
+    def test_keeps_unknown_columns(self):
+        rows = ([*row, f'<b>id {i}</b>'] for i, row in zip(range(2), self.rows(2)))
+        out = StringIO()
+        with redirect_stdout(out):
+            wtf.print_vacancies_paged(wtf.csv_filter_rows(rows, self.header + ['vacancy_id']), wtf.replacement_dic)
+        self.assertIn('| № | vacancy_id | Название', out.getvalue())
+        self.assertIn('| id 1 ', out.getvalue())
+
+    def test_row_range(self):
+        self.assertEqual(wtf.row_range('10 20'), (9, 10))
+        self.assertEqual(wtf.row_range('5'), (4, None))
+
+
+class CleanFieldTest(TestCase):
+
+    def test_tags_and_spaces(self):
+        self.assertEqual(wtf.clean_field('<p>Опыт  работы</p>\n <b>Python</b>\n'), 'Опыт работы, Python, ')
+
+    def test_leading_spaces(self):
+        self.assertEqual(wtf.clean_field('  a \t b'), 'a b')
+        self.assertEqual(wtf.clean_field(' \n b'), ', b')
+
+    def test_limit_keeps_trimmed_value(self):
+        text = '<div>слово   слово</div>\n' * 200 + '<p'
+        full, limited = wtf.clean_field(text), wtf.clean_field(text, 100)
+        self.assertGreater(len(limited), 100)
+        self.assertLess(len(limited), len(full))
+        self.assertTrue(full.startswith(limited))
+
+
+class VacancyQueryTest(TestCase):
+    header = PagedVacanciesTest.header
+    rows = [['Python dev', 'd', 'Python\nSQL', 'noExperience', 'True', 'A', '1000', '2000', 'True', 'USD', 'Москва',
+             '2022-07-05T18:19:30+0300'],
+            ['Python lead', 'd', 'Python', 'moreThan6', 'False', 'B', '100000', '200000', 'True', 'RUR', 'Москва',
+             '2021-01-05T18:19:30+0300'],
+            ['Java dev', 'd', 'Java\nSQL', 'between1And3', 'False', 'C', '50000', '70000', 'True', 'RUR', 'Казань',
+             '2020-01-05T18:19:30+0300'],
+            ['Python junior', 'd', '', 'noExperience', 'False', 'D', '1', '2', 'True', 'RUR', 'Москва',
+             '2020-01-05T18:19:30+0300']]
+
+    def names(self, **kwargs):
+        return [line[0] for line in wtf.VacancyQuery(**kwargs).apply(iter(self.rows), self.header)]
+
+    def test_no_filters_skips_incomplete_rows(self):
+        self.assertEqual(self.names(), ['Python dev', 'Python lead', 'Java dev'])
+
+    def test_salary_in_rubles(self):
+        self.assertEqual(self.names(salary=100000), ['Python dev', 'Python lead'])
+
+    def test_predicates(self):
+        self.assertEqual(self.names(key_skills=['SQL'], area_name='Москва'), ['Python dev'])
+        self.assertEqual(self.names(published_from='2021-01-01', premium=False), ['Python lead'])
+        self.assertEqual(self.names(name='dev', experience_id='between1And3'), ['Java dev'])
+
+    def test_top_sorted_by_salary(self):
+        self.assertEqual(self.names(sort_by='salary', reverse=True, top=2), ['Python lead', 'Python dev'])
+        self.assertEqual(self.names(sort_by='salary', top=1), ['Java dev'])
+
+
+class VacancyIndexTest(TestCase):
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        with open(self.file_name, 'w', encoding='utf_8_sig', newline='') as file:
+            file.write(','.join(PagedVacanciesTest.header) + '\r\n')
+            file.write('\r\n'.join(','.join(f'"{x}"' for x in row) for row in VacancyQueryTest.rows))
+
+    def tearDown(self):
+        for name in (self.file_name, self.file_name + INDEX_SUFFIX, self.file_name + CACHE_SUFFIX):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def test_lookup_reads_only_matching_rows(self):
+        index = load_index(self.file_name)
+        self.assertEqual(index.lookup('name', 'Python'), [0, 1, 3])
+        self.assertEqual(index.lookup('key_skills', 'SQL'), [0, 2])
+        self.assertEqual(list(index.rows(self.file_name, [2, 3])), VacancyQueryTest.rows[2:])
+        self.assertTrue(os.path.exists(self.file_name + INDEX_SUFFIX))
+        self.assertEqual(load_index(self.file_name).lookup('name', 'ja'), [])
+
+    def test_saved_index_same_as_built(self):
+        load_index(self.file_name)
+        built, loaded = task2.VacancyIndex(self.file_name), load_index(self.file_name)
+        self.assertEqual(vars(loaded), vars(built))
+
+    def test_rebuilds_broken_index(self):
+        with open(self.file_name + INDEX_SUFFIX, 'wb') as file:
+            file.write(b'not npz')
+        self.assertEqual(load_index(self.file_name).lookup('name', 'Python'), [0, 1, 3])
+
+    def test_profession_stats_matches_columnar(self):
+        expected = columnar_partial(load_columns_cached(self.file_name), 'Python').report()
+        self.assertEqual(vars(profession_stats(self.file_name, 'Python').report()), vars(expected))
+
+    def test_query_rows_uses_index(self):
+        query = wtf.VacancyQuery(key_skills=['SQL'], name='dev')
+        header, rows = wtf.query_rows(self.file_name, query, load_index(self.file_name))
+        self.assertEqual([line[0] for line in rows], ['Python dev', 'Java dev'])
+
+
+class RankTest(TestCase):
+    def test_ties_at_end_of_list(self):
+        ls = [('Омск', 3), ('Пермь', 1), ('Казань', 1)]
+        alphabetic_sort(ls)
+        self.assertEqual(ls, [('Омск', 3), ('Казань', 1), ('Пермь', 1)])
+
+    def test_adjacent_tie_groups(self):
+        ls = [('В', 2), ('Б', 2), ('Г', 1), ('А', 1), ('Д', 0)]
+        alphabetic_sort(ls)
+        self.assertEqual(ls, [('Б', 2), ('В', 2), ('А', 1), ('Г', 1), ('Д', 0)])
+
+    def test_top_same_as_full_sort(self):
+        values = {f'city{rd.randint(0, 10 ** 6)}': rd.randint(0, 5) for _ in range(300)}
+        for top in (0, 1, 10, 299, 300, 1000):
+            self.assertEqual(rank(values, top), rank(values)[:top])
+
+
+class BenchTest(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.data_dir):
+            os.remove(os.path.join(self.data_dir, name))
+        os.rmdir(self.data_dir)
+
+    def test_synthetic_files_are_reproducible(self):
+        file_name = bench.dataset(300, data_dir=self.data_dir)
+        other = os.path.join(self.data_dir, 'other.csv')
+        bench.generate_csv(other, 300)
+        with open(file_name, 'rb') as first, open(other, 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+        rows = csv_reader(file_name)
+        self.assertEqual((rows[0], len(rows)), (bench.STATS_HEADER, 301))
+        report = columnar_partial(load_columns_cached(file_name), 'Аналитик').report()
+        self.assertLessEqual(set(report.years_l), set(bench.YEARS))
+        self.assertIn('Москва', report.city_A_l)
+
+    def test_vacancies_file_fits_vacancy_mode(self):
+        rows = csv_reader(bench.dataset(50, vacancies=True, data_dir=self.data_dir))
+        self.assertEqual(len(wtf.csv_filter(rows[1:], rows[0])), 50)
+
+    def test_results_round_trip(self):
+        file_name = os.path.join(self.data_dir, 'results.json')
+        bench.save_results(dict(version='a', results=[dict(stage='sort', rows=1, seconds=1.0)]), file_name)
+        bench.save_results(dict(version='b', results=[dict(stage='sort', rows=1, seconds=2.0)]), file_name)
+        runs = bench.load_results(file_name)
+        self.assertEqual(len(bench.regressions(runs[0], runs[1])), 1)
+        self.assertEqual(bench.regressions(runs[1], runs[0]), [])
+
+    def test_startup_and_cleaning_regressions(self):
+        old = dict(version='a', results=[dict(stage='startup task2', ms=10.0),
+                                         dict(stage='clean_field', mb_per_s=50.0)])
+        new = dict(version='b', results=[dict(stage='startup task2', ms=20.0),
+                                         dict(stage='clean_field', mb_per_s=25.0)])
+        self.assertEqual(bench.regressions(old, new), ['startup task2: 10.0 мс -> 20.0 мс, x2.00 после a',
+                                                       'clean_field: 50.0 МБ/с -> 25.0 МБ/с, x2.00 после a'])
+        self.assertEqual(bench.regressions(new, old), [])
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.stats_name = os.path.join(self.dir, 'stats.jsonl')
+        self.env = {x: os.environ.pop(x, None) for x in (STATS_ENV, PROFILE_ENV, PROFILE_DIR_ENV)}
+
+    def tearDown(self):
+        for key, value in self.env.items():
+            os.environ.pop(key, None)
+            if value is not None:
+                os.environ[key] = value
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    row = ['Python', '10', '30', 'RUR', 'A', '2007-01-01T00:00:00+0300']
+
+    def records(self):
+        with open(self.stats_name, encoding='utf_8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_disabled_by_default(self):
+        with stage('load_columns') as record:
+            load_columns([self.row], pk1)
+        self.assertEqual(record, dict(stage='load_columns', rows=None, skipped=None))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_rows_and_skipped(self):
+        os.environ[STATS_ENV] = self.stats_name
+        load_columns([self.row, self.row[:2] + [''] + self.row[3:], self.row], pk1)
+        record, = self.records()
+        self.assertEqual((record['stage'], record['rows'], record['skipped']), ('load_columns', 3, 1))
+        self.assertGreater(record['rows_per_s'], 0)
+        self.assertIn('peak_rss_mb', record)
+
+    def test_profile_dump(self):
+        os.environ[PROFILE_ENV] = 'outer,inner'
+        os.environ[PROFILE_DIR_ENV] = self.dir
+        with stage('outer'), stage('inner'):
+            sorted(range(1000))
+        self.assertEqual(os.listdir(self.dir), [f'outer.{os.getpid()}.prof'])
+
+
+class RateTableTest(TestCase):
+    rates = RateTable({'2007-03': {'USD': 26.0, 'EUR': 35.0}, '2007-01': {'USD': 27.0}, '2007-05': {'EUR': 36.0}})
+
+    def test_fallback_for_missing_months(self):
+        self.assertEqual([self.rates.rate('USD', f'2007-0{x}') for x in range(1, 6)], [27.0, 27.0, 26.0, 26.0, 26.0])
+        self.assertEqual([self.rates.rate('EUR', f'2007-0{x}') for x in range(1, 6)], [35.0, 35.0, 35.0, 35.0, 36.0])
+        self.assertEqual(self.rates.rate('USD', '2006-12-31T00:00:00+0300'), 27.0)
+        self.assertEqual(self.rates.rate('EUR', '2022-07-05T18:19:30+0300'), 36.0)
+        self.assertEqual(self.rates.rate('KZT', '2007-02'), 0.13)
+        self.assertEqual(self.rates.rate('RUR', '2007-02'), 1)
+
+    def test_from_csv(self):
+        fd, file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf_8', newline='') as file:
+            file.write('date,USD,EUR\r\n2007-01-15,27,\r\n2007-03-01,26,35\r\n')
+        try:
+            rates = RateTable.from_csv(file_name)
+        finally:
+            os.remove(file_name)
+        self.assertEqual(rates.table.tolist(), self.rates.table[:3].tolist())
+
+    def test_rates_are_opt_in(self):
+        with tempfile.TemporaryDirectory() as folder, chdir(folder):
+            with open('currency_rates.csv', 'w', encoding='utf_8') as file:
+                file.write('date,USD\n2007-01,27\n')
+            self.assertIsNone(task2.load_rates())
+            self.assertEqual(task2.load_rates('currency_rates.csv').rate('USD', '2007-01'), 27.0)
+
+    def test_columns_same_as_rows(self):
+        rows = [['Python', '100', '300', 'USD', 'A', '2007-02-01T00:00:00+0300'],
+                ['Java', '100', '300', 'EUR', 'B', '2008-02-01T00:00:00+0300'],
+                ['Python', '100', '300', 'RUR', 'A', '2007-05-01T00:00:00+0300']]
+        expected = VacancyStats('Python', pk1, self.rates).update(rows)
+        columns = load_columns(iter(rows), pk1, rates=self.rates)
+        self.assertEqual(columns['salary'].tolist(), [5400.0, 7200.0, 200.0])
+        self.assertEqual(vars(columnar_partial(columns, 'Python').report()), vars(expected.report()))
+
+    def test_vacancy_query_salary(self):
+        rows = [x[:] for x in VacancyQueryTest.rows]
+        names = lambda **kwargs: [x[0] for x in wtf.VacancyQuery(**kwargs).apply(iter(rows), PagedVacanciesTest.header)]
+        self.assertEqual(names(salary=100000), ['Python dev', 'Python lead'])
+        self.assertEqual(names(salary=100000, rates=RateTable({'2022-07': {'USD': 40.0}})), ['Python lead'])
+
+
+class PeriodTest(TestCase):
+    dates = ['2020-12-28T10:00:00+0300', '2021-01-03T23:59:00+0300', '2021-01-04T00:00:00+0300',
+             '2015-12-31T10:00:00+0300', '1969-12-29T10:00:00+0300', '2022-07-05T18:19:30+0300']
+
+    def rows(self):
+        rng = rd.Random(5)
+        return [[rng.choice(['Python', 'Java']), '100', str(rng.randint(100, 900)), 'RUR', rng.choice('AB'),
+                 x] for x in self.dates * 3]
+
+    def test_vectorised_keys_match_row_keys(self):
+        columns = load_columns(iter(self.rows()), pk1)
+        for period in PERIODS:
+            codes, labels = period_buckets(columns, period)
+            keys = codes.tolist() if labels is None else [labels[x] for x in codes.tolist()]
+            self.assertEqual(keys, [period_key(x[5], period) for x in self.rows()])
+
+    def test_iso_week_edges(self):
+        self.assertEqual([period_key(x, 'week') for x in self.dates[:4]],
+                         ['2020-W53', '2020-W53', '2021-W01', '2015-W53'])
+
+    def test_columnar_same_as_rows(self):
+        columns = load_columns(iter(self.rows()), pk1)
+        for period in PERIODS:
+            expected = VacancyStats('Python', pk1, period=period).update(self.rows()).report()
+            self.assertEqual(vars(columnar_partial(columns, 'Python', period).report()), vars(expected))
+            self.assertEqual(vars(batch_reports(columns, ['Python'], period=period)['Python']), vars(expected))
+
+    def test_monthly_report(self):
+        report = VacancyStats('Python', pk1, period='month').update(self.rows()).report()
+        self.assertEqual(report.years_l[:2], ['2020-12', '2021-01'])
+        with redirect_stdout(StringIO()) as out:
+            report.print_data()
+        self.assertTrue(out.getvalue().startswith("Динамика уровня зарплат по месяцам: {'2020-12': "))
+        with tempfile.TemporaryDirectory() as folder:
+            report.generate_excel(os.path.join(folder, 'report.xlsx'))
+            sheet = openpyxl.load_workbook(os.path.join(folder, 'report.xlsx')).worksheets[0]
+        self.assertEqual((sheet.title, sheet['A1'].value, sheet['A2'].value),
+                         ('Статистика по месяцам', 'Месяц', '2020-12'))
+
+
+class QuantileSketchTest(TestCase):
+    def rank_error(self, sketch, values):
+        values = sorted(values)
+        return max(abs(sum(x <= value for x in values) / len(values) - point)
+                   for point, value in zip((0.1, 0.5, 0.9), sketch.quantiles()))
+
+    def test_exact_while_small(self):
+        values = [rd.Random(1).random() for _ in range(150)]
+        self.assertEqual(QuantileSketch().update_many(values).quantiles(),
+                         [sorted(values)[x] for x in (14, 74, 134)])
+
+    def test_bounded_memory_and_error(self):
+        rng = rd.Random(2)
+        values = [rng.lognormvariate(11, 0.6) for _ in range(50000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.update(value)
+        self.assertLess(sum(len(x) for x in sketch.levels), 1000)
+        self.assertEqual(sketch.count, 50000)
+        self.assertLess(self.rank_error(sketch, values), 0.02)
+
+    def test_merge_chunks(self):
+        rng = rd.Random(3)
+        values = [rng.random() for _ in range(40000)]
+        merged = QuantileSketch()
+        for i in range(0, len(values), 5000):
+            merged.merge(QuantileSketch(seed=i).update_many(values[i:i + 5000]))
+        self.assertEqual(merged.count, 40000)
+        self.assertLess(self.rank_error(merged, values), 0.02)
+
+    def test_columnar_same_as_rows(self):
+        rows = PeriodTest().rows()
+        expected = VacancyStats('Python', pk1, quantiles=True).update(rows).report()
+        report = columnar_partial(load_columns(iter(rows), pk1), 'Python', quantiles=True).report()
+        self.assertEqual(vars(report), vars(expected))
+        self.assertEqual(len(report.year_q_l), len(report.years_l))
+        salaries = sorted(sal(x[1], x[2], x[3]) for x in rows if x[4] == report.city_A_l[0])
+        self.assertEqual(report.city_q_l[0][1], int(salaries[(len(salaries) + 1) // 2 - 1]))
@@ -1,327 +1,370 @@
+import argparse
 import csv
-import codecs
-from decimal import Decimal
-import openpyxl
-from openpyxl.styles import Font, Border, Side
-from matplotlib import pyplot as plt
-import numpy as np
+import datetime
+import heapq
+import itertools
 import re
 import sys
 
-import prettytable
-from prettytable import PrettyTable
-
-
-class Report:
-    year_prof_sal = year_prof_vacs = border = ""
-
-    def __init__(self, year_sal, year_vacs, year_prof_sal, year_prof_vacs, city_sal, city_part):
-        self.year_prof_sal = year_prof_sal
-        self.year_prof_vacs = year_prof_vacs
-        self.years_l = [*year_sal.keys()]
-        self.year_sal_l = [*year_sal.values()]
-        self.year_prof_sal_l = [*fill_gaps(year_prof_sal, year_sal, 0).values()]
-        self.year_vacs_l = [*year_vacs.values()]
-        self.year_prof_vacs_l = [*fill_gaps(year_prof_vacs, year_sal, 0).values()]
-        self.city_A_l = [*city_sal.keys()]
-        self.sal_A_l = [*city_sal.values()]
-        self.city_B_l = [*city_part.keys()]
-        self.part_B_l = [*city_part.values()]
-
-    def print_data(self):
-        print(f"Динамика уровня зарплат по годам: {dict(zip(self.years_l, self.year_sal_l))}")
-        print(f"Динамика количества вакансий по годам: {dict(zip(self.years_l, self.year_vacs_l))}")
-        print(f"Динамика уровня зарплат по годам для выбранной профессии: {self.year_prof_sal}")
-        print(f"Динамика количества вакансий по годам для выбранной профессии: {self.year_prof_vacs}")
-        print(f"Уровень зарплат по городам (в порядке убывания): {dict(zip(self.city_A_l, self.sal_A_l))}")
-        print(f"Доля вакансий по городам (в порядке убывания): {dict(zip(self.city_B_l, self.part_B_l))}")
-
-    def generate_excel(self):
-        wb = openpyxl.Workbook()
-        ws1 = wb.active
-        ws1.title = "Статистика по годам"
-        ws2 = wb.create_sheet("Статистика по городам")
-        ws2.append(['Город', 'Уровень зарплат', "", 'Город', 'Доля вакансий'])
-        thin = Side(style="thin", color="FF000000")
-        self.border = Border(left=thin, right=thin, top=thin, bottom=thin)
-        self.fill_columns(1, 1, ws1, self.twod_array(
-            ["Год", "Средняя зарплата", f"Средняя зарплата - {prof_name}", "Количество вакансий",
-             f"Количество вакансий - {prof_name}"]))
-        self.fill_columns(1, 2, ws1, [self.years_l, self.year_sal_l, self.year_prof_sal_l,
-                                      self.year_vacs_l, self.year_prof_vacs_l])
-        self.fill_columns(1, 1, ws2, self.twod_array(['Город', 'Уровень зарплат', "", 'Город', 'Доля вакансий']))
-        self.fill_columns(1, 2, ws2, [self.city_A_l, self.sal_A_l, [""] * 10, self.city_B_l, self.part_B_l])
-        self._format_column_width(ws1, ws2)
-        wb.save("report.xlsx")
-
-    def twod_array(self, data: list):
-        return list(map(lambda x: [x], data))
-
-    def fill_columns(self, start_col, start_row, sheet, arrays: list):
-        max_col_index = len(arrays) - 1
-        max_row_index = len(max(arrays, key=len))
-        i = 0
-        for col in sheet.iter_cols(min_col=start_col, max_col=max_col_index + start_col,
-                                   max_row=max_row_index + start_row, min_row=start_row):
-            for j in range(len(arrays[i])):
-                col[j].value = arrays[i][j]
-                if arrays[i][j] != "" and col[j] is not None:
-                    if col[j].row == 1:
-                        col[j].font = Font(bold=True)
-                    if isinstance(arrays[i][j], float):
-                        col[j].style = "Percent"
-                    col[j].border = self.border
-            i += 1
-
-    def _format_column_width(self, sheet1, sheet2):
-        self._set_max_width_and_styles(sheet1, len(self.years_l) + 1)
-        self._set_max_width_and_styles(sheet2, len(self.city_A_l) + 10)
-
-    def _set_max_width_and_styles(self, sheet, length):
-        for col in sheet.iter_cols(max_col=5, min_row=1, max_row=length):
-            sheet.column_dimensions[col[0].column_letter].width = \
-                len(str(max(col, key=lambda x: len(str(x.value)) if x.value is not None else 0).value)) + 2
-
-    def generate_image(self):
-        figure, axis = plt.subplots(2, 2)
-        bar_x = np.arange(len(self.years_l))
-        axis[0, 0].bar(bar_x - 0.2, self.year_sal_l, 0.4, label="средняя з/п")
-        axis[0, 0].bar(bar_x + 0.2, self.year_prof_sal_l, 0.4, label=f"з/п {prof_name}")
-        axis[0, 0].set_xticks(bar_x, self.years_l, rotation=90, fontsize=8)
-        axis[0, 0].set_title("Уровень зарплат по годам")
-        axis[0, 0].legend(fontsize=8)
-        axis[0, 0].grid(visible=True, axis="y")
-        axis[0, 1].bar(bar_x - 0.2, self.year_vacs_l, 0.4, label="Количество вакансий")
-        axis[0, 1].bar(bar_x + 0.2, self.year_prof_vacs_l, 0.4, label=f"Количество вакансий \n{prof_name}")
-        axis[0, 1].set_xticks(bar_x, self.years_l, rotation=90, fontsize=8)
-        axis[0, 1].set_title("Количество вакансий по годам")
-        axis[0, 1].legend(loc="upper left", fontsize=8)
-        axis[0, 1].grid(visible=True, axis="y")
-        for i in range(len(self.city_A_l)):
-            if self.city_A_l[i].count("-") == 1 or self.city_A_l[i].count(" ") == 1:
-                self.city_A_l[i] = self.city_A_l[i].replace("-", "-\n", 1).replace(" ", " \n", 1)
-        axis[1, 0].barh(np.arange(len(self.city_A_l)), self.sal_A_l, align="edge")
-        axis[1, 0].set_yticks(np.arange(len(self.city_A_l)), labels=self.city_A_l, fontsize=6)
-        axis[1, 0].invert_yaxis()
-        axis[1, 0].grid(visible=True, axis="x")
-        axis[1, 0].set_title("Уровень зарплат по городам")
-        self.part_B_l = [1 - sum(self.part_B_l)] + self.part_B_l
-        self.city_B_l = ["Другие"] + self.city_B_l
-        axis[1, 1].pie(self.part_B_l, labels=self.city_B_l, textprops={'fontsize': 6})
-        axis[1, 1].set_title("Доля вакансий по городам")
-        plt.tight_layout()
-        plt.savefig('graph.png')
-
-
-class ProfKeys:
-    def __init__(self, headers):
-        self.name = headers.index('name')
-        self.salary_from = headers.index('salary_from')
-        self.salary_to = headers.index('salary_to')
-        self.salary_currency = headers.index('salary_currency')
-        self.area_name = headers.index('area_name')
-        self.published_at = headers.index('published_at')
-
-
-currency_to_rub = {
-    "AZN": 35.68,
-    "BYR": 23.91,
-    "EUR": 59.90,
-    "GEL": 21.74,
-    "KGS": 0.76,
-    "KZT": 0.13,
-    "RUR": 1,
-    "UAH": 1.64,
-    "USD": 60.66,
-    "UZS": 0.0055,
-}
-
-salary_all_years = {}
-count_all_vacs = {}
-salary_prof_years = {}
-count_prof_vacs = {}
-salary_city = {}
-part_city = {}
-salary_city_part = {}
-count_city_vacs = {}
-
-
-def fill(cur: dict, ref: dict, filler):
-    if len(cur) == 0:
-        for x in ref.keys():
-            cur[x] = filler
-
-
-def fill_gaps(cur: dict, ref: dict, filler):
-    temp = cur
-    for x in ref.keys():
-        if x not in temp:
-            temp[x] = filler
-    return temp
-
-
-def year(ls):
-    return int(ls[Keys.published_at][0:4])
-
-
-def sal(*sal_list):
-    return currency_to_rub[sal_list[2]] * (float(sal_list[0]) + float(sal_list[1])) / 2
-
-
-def for_loop_div(key_source: dict, divide: dict, action):
-    for x in key_source.keys():
-        divide[x] = action(divide[x], key_source[x])
-
-
-def csv_reader(file_name):
-    file = codecs.open(file_name, 'r', 'utf_8_sig')
-    reader = csv.reader(file)
-    data = list(reader)
-    file.close()
-    return data
-
+from task2 import csv_rows, columnar_partial, load_columns_cached, load_rates, currency_to_rub, stage, FLAGS, PERIODS, \
+    VACANCY_FIELDS, Vacancy, aggregate_file, batch_reports, load_index, profession_stats, render_reports, \
+    update_stats
+
+PAGE_SIZE = 50
+TRIM = 100
+CLEAN_WINDOW = 4
+DISPLAY_LIMITS = dict(description=TRIM)
+SALARY_FIELDS = ("salary_from", "salary_to", "salary_gross", "salary_currency")
+EXPERIENCE_ORDER = ["noExperience", "between1And3", "between3And6", "moreThan6"]
+ENGINE_OPTIONS = dict(columnar={"period", "quantiles", "rates"}, parallel={"quantiles", "rates"},
+                      index={"period", "rates"}, incremental={"period", "quantiles", "rates"})
+JOB_COLUMNS = ("file", "profession", "image", "excel", "period", "quantiles")
+TAG = re.compile(r"<[^>]+>")
+
+replacement_dic = dict(name="Название", description="Описание", key_skills="Навыки", experience_id="Опыт работы",
+                   premium="Премиум-вакансия", employer_name="Компания", salary_from="Нижняя граница вилки оклада",
+                   salary_to="Верхняя граница вилки оклада", salary_range="Оклад",
+                   salary_gross="Оклад указан до вычета налогов", salary_currency="Идентификатор валюты оклада",
+                   area_name="Название региона", published_at="Дата и время публикации вакансии",
+                   publish_day="Дата публикации вакансии", AZN="Манаты", BYR="Белорусские рубли", EUR="Евро",
+                   GEL="Грузинский лари", KGS="Киргизский сом", KZT="Тенге", RUR="Рубли", UAH="Гривны",
+                   USD="Доллары", UZS="Узбекский сум", noExperience="Нет опыта", between1And3="От 1 года до 3 лет",
+                   between3And6="От 3 до 6 лет", moreThan6="Более 6 лет")
 
-def addToDict(key_val, dict, val):
-    if key_val in dict.keys():
-        dict[key_val] += val
-    else:
-        dict[key_val] = val
-
-
-def create_dicts(data, name):
-    number = 0
-    for line in data:
-        if all(line):
-            number += 1
-            addToDict(year(line), salary_all_years,
-                      sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-            addToDict(line[Keys.area_name], salary_city,
-                      sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-            addToDict(year(line), count_all_vacs, 1)
-            addToDict(line[Keys.area_name], count_city_vacs, 1)
-            if name in line[Keys.name]:
-                addToDict(year(line), salary_prof_years,
-                          sal(line[Keys.salary_from], line[Keys.salary_to], line[Keys.salary_currency]))
-                addToDict(year(line), count_prof_vacs, 1)
-    for_loop_div(count_all_vacs, salary_all_years, lambda x, y: int(x / y))
-    for_loop_div(count_prof_vacs, salary_prof_years, lambda x, y: int(x / y))
-    return number
-
-
-def calculate_part_city(num):
-    for x in count_city_vacs.keys():
-        calc_num = Decimal(count_city_vacs[x] / num).quantize(Decimal("1.0000"))
-        if calc_num >= 0.01:
-            part_city[x] = calc_num.__float__()
-            salary_city_part[x] = int(salary_city[x] / count_city_vacs[x])
-
-
-def alphabetic_sort(ls: list):
-    temp_list = []
-    for i in range(1, len(ls)):
-        if ls[i][1] == ls[i - 1][1]:
-            temp_list.append(ls[i])
-            if ls[i - 1] not in temp_list:
-                temp_list.append(ls[i - 1])
-        elif len(temp_list) > 1 and ls[i][1] != ls[i - 1][1]:
-            ls[ls.index(temp_list[0]) - 1:i] = sorted(temp_list, key=lambda f: f[0])
-            temp_list.clear()
 
 def printDict(d):
     for key, value in d.items():
         print(key + ':', value)
 
 
+def _clean(text):
+    if "<" in text:
+        text = TAG.sub("", text)
+    return ", ".join([" ".join(line.split()) for line in text.split("\n")])
+
+
+def clean_field(text, limit=None):
+    window = CLEAN_WINDOW * (limit or 0)
+    while window and window < len(text):
+        prefix = text[:window]
+        tag_start = prefix.find("<", prefix.rfind(">") + 1)
+        result = _clean(prefix if tag_start == -1 else prefix[:tag_start])
+        if len(result) > limit:
+            return result
+        window *= 2
+    return _clean(text)
+
+
+def csv_filter_rows(reader, list_naming, limits=None):
+    limits = limits or {}
+    clean = lambda field, text: clean_field(text, limits[field])[:limits[field] + 1] if field in limits \
+        else clean_field(text)
+    return Vacancy.records(reader, list_naming, clean)
+
+
 def csv_filter(reader, list_naming):
-    temp_list = []
-    for line in reader:
-        filtered_line = [re.sub(r"<[^>]+>", "", b, flags=re.S) for b in line]
-        if all(line) and len(filtered_line) == len(list_naming):
-            temp_list.append(
-                [re.sub(r'\s+', " ", ', '.join(
-                    [f.strip() for f in g.split("\n")])) for g in filtered_line])
-    dicts_list = [dict(zip(list_naming, line)) for line in temp_list]
-    return dicts_list
+    with stage("csv_filter") as record:
+        data = list(csv_filter_rows(reader, list_naming))
+        record["rows"] = len(data)
+    return data
 
 
-def print_vacancies(data_vacancies, dic_naming):
-    counter = 1
+def rate_rub(row, rates=None):
+    if rates is None:
+        return currency_to_rub[row["salary_currency"]]
+    return rates.rate(row["salary_currency"], row["published_at"])
+
+
+def salary_rub(row, rates=None):
+    return rate_rub(row, rates) * (float(row["salary_from"]) + float(row["salary_to"])) / 2
+
+
+class VacancyQuery:
+    sort_keys = dict(salary=salary_rub, published_at=lambda row: row["published_at"], name=lambda row: row["name"],
+                     area_name=lambda row: row["area_name"], employer_name=lambda row: row["employer_name"],
+                     experience_id=lambda row: EXPERIENCE_ORDER.index(row["experience_id"]),
+                     premium=lambda row: row["premium"] == "True",
+                     key_skills=lambda row: len(row["key_skills"].split("\n")))
+
+    def __init__(self, salary=None, currency=None, published_from=None, published_to=None, experience_id=None,
+                 premium=None, key_skills=None, area_name=None, name=None, sort_by=None, reverse=False, top=None,
+                 rates=None):
+        self.predicates = []
+        self.lookups = [("key_skills", x) for x in key_skills or ()] + ([] if name is None else [("name", name)])
+        if salary is not None:
+            self.predicates.append(lambda row: rate_rub(row, rates) * float(row["salary_from"])
+                                   <= salary <= rate_rub(row, rates) * float(row["salary_to"]))
+        if currency is not None:
+            self.predicates.append(lambda row: row["salary_currency"] == currency)
+        if published_from is not None:
+            self.predicates.append(lambda row: row["published_at"][:10] >= published_from)
+        if published_to is not None:
+            self.predicates.append(lambda row: row["published_at"][:10] <= published_to)
+        if experience_id is not None:
+            self.predicates.append(lambda row: row["experience_id"] == experience_id)
+        if premium is not None:
+            self.predicates.append(lambda row: (row["premium"] == "True") == premium)
+        if key_skills:
+            self.predicates.append(lambda row: set(key_skills) <= set(row["key_skills"].split("\n")))
+        if area_name is not None:
+            self.predicates.append(lambda row: row["area_name"] == area_name)
+        if name is not None:
+            self.predicates.append(lambda row: name in row["name"])
+        self.sort_key = None if sort_by is None else self.sort_keys[sort_by]
+        if sort_by == "salary" and rates is not None:
+            self.sort_key = lambda row: salary_rub(row, rates)
+        self.reverse = reverse
+        self.top = top
+
+    def apply(self, reader, list_naming):
+        rows = ((line, dict(zip(list_naming, line))) for line in reader
+                if all(line) and len(line) == len(list_naming))
+        rows = (x for x in rows if all(predicate(x[1]) for predicate in self.predicates))
+        if self.sort_key is None:
+            return (line for line, row in itertools.islice(rows, self.top))
+        key = lambda x: self.sort_key(x[1])
+        if self.top is None:
+            rows = sorted(rows, key=key, reverse=self.reverse)
+        else:
+            rows = (heapq.nlargest if self.reverse else heapq.nsmallest)(self.top, rows, key=key)
+        return (line for line, row in rows)
+
+
+def query_rows(file_name, query, index=None):
+    rows = csv_rows(file_name)
+    header = next(rows, None)
+    if header is None:
+        return None, iter(())
+    lookups = [x for x in query.lookups if index is not None and x[0] in index.columns]
+    if lookups:
+        row_ids = set(index.lookup(*lookups[0]))
+        for lookup in lookups[1:]:
+            row_ids.intersection_update(index.lookup(*lookup))
+        rows.close()
+        rows = index.rows(file_name, sorted(row_ids))
+    return header, query.apply(rows, header)
+
+
+def vacancies_table(data_vacancies, dic_naming, counter=1):
+    import prettytable
+    from prettytable import PrettyTable
+
     table = PrettyTable()
     table.align = 'l'
     table.hrules = prettytable.ALL
     for el in data_vacancies:
-        formatter(el)
-        for key in dic_naming:
-            if key in el:
-                el[dic_naming[key]] = el.pop(key)
+        row = formatter(el)
         if len(table.field_names) == 0:
-            table.field_names = ["№"] + [x for x in el.keys()]
+            keys = [x for x in row if x not in dic_naming] + [x for x in dic_naming if x in row]
+            table.field_names = ["№"] + [dic_naming.get(x, x) for x in keys]
             table._max_width = dict(zip(table.field_names, len(table.field_names) * [20]))
-        table.add_row([counter] + [r for r in el.values()])
+        table.add_row([counter] + [row[x] for x in keys])
         counter += 1
-    print(table)
-
-
-def formatter(row):
-    trim = lambda x: x[0:100] + "..." if len(x) > 100 else x
-    row['experience_id'] = replacement_dic[row['experience_id']]
-    row["premium"] = row["premium"].replace("False", "Нет").replace("True", "Да")
-    gross = lambda x: "Без вычета налогов" if x == "True" else "С вычетом налогов"
-    row["salary_range"] = f"{'{:,.0f}'.format(float(row.pop('salary_from'))).replace(',', ' ')} " \
-                          f"- {'{:,.0f}'.format(float(row.pop('salary_to'))).replace(',', ' ')} " \
-                          f"({replacement_dic[row.pop('salary_currency')]}) " \
-                          f"({gross(row.pop('salary_gross'))})"
-    row["publish_day"] = ".".join(row.pop("published_at")[:10].split("-")[::-1])
-    row["key_skills"] = row["key_skills"].replace(', ', '\n')
-    for key in row:
-        row[key] = trim(row[key])
-
-choice = input("Вакансии или Статистика: ")
-while choice not in ["Вакансии", "Статистика"]:
-    choice = input("Вакансии или Статистика: ")
+    return table
 
-if choice == "Статистика":
-    file_name = input("Введите название файла: ")
-    prof_name = input("Введите название профессии: ")
-
-    data = csv_reader(file_name)
-    Keys = ProfKeys(data.pop(0))
-    number_of_vacs = create_dicts(data, prof_name)
-    calculate_part_city(number_of_vacs)
-    city_part_vacs = sorted(part_city.items(), key=lambda x: x[1], reverse=True)
-    city_salary = sorted(salary_city_part.items(), key=lambda x: x[1], reverse=True)
-    alphabetic_sort(city_salary)
-    fill(salary_prof_years, salary_all_years, 0)
-    fill(count_prof_vacs, count_all_vacs, 0)
-    report = Report(salary_all_years, count_all_vacs, salary_prof_years, count_prof_vacs, dict(city_salary[0:10]),
-                    dict(city_part_vacs[0:10]))
-    report.print_data()
-    report.generate_image()
-else:
-    temp = csv_reader(input())
-
-    replacement_dic = dict(name="Название", description="Описание", key_skills="Навыки", experience_id="Опыт работы",
-                           premium="Премиум-вакансия", employer_name="Компания", salary_from="Нижняя граница вилки оклада",
-                           salary_to="Верхняя граница вилки оклада", salary_range="Оклад",
-                           salary_gross="Оклад указан до вычета налогов", salary_currency="Идентификатор валюты оклада",
-                           area_name="Название региона", published_at="Дата и время публикации вакансии",
-                           publish_day="Дата публикации вакансии", AZN="Манаты", BYR="Белорусские рубли", EUR="Евро",
-                           GEL="Грузинский лари", KGS="Киргизский сом", KZT="Тенге", RUR="Рубли", UAH="Гривны",
-                           USD="Доллары", UZS="Узбекский сум", noExperience="Нет опыта", between1And3="От 1 года до 3 лет",
-                           between3And6="От 3 до 6 лет", moreThan6="Более 6 лет")
-
-    if len(temp) == 0:
-        print("Пустой файл")
-        sys.exit()
 
-    dateFiltered = csv_filter(temp[1:], temp[0])
-    if len(dateFiltered) == 0:
-        print("Нет данных")
+@stage("print_vacancies")
+def print_vacancies(data_vacancies, dic_naming):
+    print(vacancies_table(data_vacancies, dic_naming))
+
+
+def print_vacancies_paged(data_vacancies, dic_naming, page_size=PAGE_SIZE, offset=0, limit=None):
+    rows = itertools.islice(data_vacancies, offset, None if limit is None else offset + limit)
+    printed = 0
+    while True:
+        page = list(itertools.islice(rows, page_size))
+        if not page:
+            return printed
+        print(vacancies_table(page, dic_naming, offset + printed + 1), flush=True)
+        printed += len(page)
+
+
+def row_range(text):
+    bounds = [int(x) for x in text.split()]
+    start = bounds[0] - 1 if bounds else 0
+    return start, bounds[1] - 1 - start if len(bounds) > 1 else None
+
+
+def formatter(vacancy):
+    trim = lambda x: x[0:TRIM] + "..." if len(x) > TRIM else x
+    row = dict(vacancy.other or {})
+    row.update((x, getattr(vacancy, x)) for x in VACANCY_FIELDS
+               if x not in SALARY_FIELDS and getattr(vacancy, x) is not None)
+    row['experience_id'] = replacement_dic[vacancy.experience_id]
+    row["premium"] = "Да" if vacancy.premium else "Нет"
+    gross = "Без вычета налогов" if vacancy.salary_gross else "С вычетом налогов"
+    row["salary_range"] = f"{'{:,.0f}'.format(vacancy.salary_from).replace(',', ' ')} " \
+                          f"- {'{:,.0f}'.format(vacancy.salary_to).replace(',', ' ')} " \
+                          f"({replacement_dic[vacancy.salary_currency]}) ({gross})"
+    row["publish_day"] = datetime.date.fromordinal(row.pop("published_at")).strftime("%d.%m.%Y")
+    row["key_skills"] = row["key_skills"].replace(', ', '\n')
+    return {key: trim(value) for key, value in row.items()}
+
+
+def profession_report(file_name, name, engine="columnar", period="year", quantiles=False, rates=None,
+                      processes=None):
+    if engine == "parallel":
+        return aggregate_file(file_name, name, processes, rates, quantiles).report()
+    if engine == "index":
+        return profession_stats(file_name, name, rates=rates, period=period).report()
+    if engine == "incremental":
+        return update_stats(file_name, name, rates, period, quantiles).report()
+    return columnar_partial(load_columns_cached(file_name, processes, rates), name, period, quantiles).report()
+
+
+def read_jobs(file_name):
+    with open(file_name, encoding="utf_8_sig", newline="") as file:
+        reader = csv.DictReader(file)
+        missing = {"file", "profession"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"В файле заданий нет столбцов: {', '.join(sorted(missing))}")
+        jobs = [dict((key, row.get(key) or None) for key in JOB_COLUMNS) for row in reader]
+    for job in jobs:
+        job["period"] = job["period"] or "year"
+        if job["period"] not in PERIODS:
+            raise ValueError(f"Неизвестный период {job['period']}, доступны: {', '.join(PERIODS)}")
+        quantiles = FLAGS.get((job["quantiles"] or "0").lower())
+        if quantiles is None:
+            raise ValueError(f"Неизвестное значение quantiles {job['quantiles']}, доступны: {', '.join(FLAGS)}")
+        job["quantiles"] = quantiles
+    return jobs
+
+
+def run_jobs(jobs, rates=None, processes=None, write_only=False):
+    datasets, reports = {}, {}
+    with stage("jobs", len(jobs)):
+        for file_name in dict.fromkeys(job["file"] for job in jobs):
+            datasets[file_name] = load_columns_cached(file_name, processes, rates)
+        groups = {}
+        for i, job in enumerate(jobs):
+            groups.setdefault((job["file"], job["period"], job["quantiles"]), []).append(i)
+        for (file_name, period, quantiles), ids in groups.items():
+            batch = batch_reports(datasets[file_name], [jobs[i]["profession"] for i in ids], period=period,
+                                  quantiles=quantiles)
+            reports.update((i, batch[jobs[i]["profession"]]) for i in ids)
+        reports = [reports[i] for i in range(len(jobs))]
+        return render_reports(reports, [job["image"] for job in jobs], [job["excel"] for job in jobs], processes,
+                              write_only)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Статистика и таблица вакансий. Без аргументов - интерактивный режим")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats", help="Статистика по профессии")
+    stats.add_argument("file_name", help="csv файл с вакансиями")
+    stats.add_argument("profession", help="Название профессии")
+    stats.add_argument("--engine", choices=ENGINE_OPTIONS, default="columnar",
+                       help="columnar - кэш столбцов, parallel - куски файла в процессах, index - индекс названий, "
+                            "incremental - досчёт дописанных в файл строк")
+    stats.add_argument("--period", choices=PERIODS, default="year")
+    stats.add_argument("--quantiles", action="store_true", help="p10, медиана и p90 зарплат")
+    stats.add_argument("--rates", help="csv с курсами валют, по умолчанию фиксированные курсы")
+    stats.add_argument("--image", default="graph.png", help="Файл графика (png, svg), пустая строка - без графика")
+    stats.add_argument("--excel", help="Файл excel отчёта")
+    stats.add_argument("--write-only", action="store_true", help="Писать excel потоково")
+    stats.add_argument("--processes", type=int)
+    stats.add_argument("--quiet", action="store_true", help="Не выводить статистику в консоль")
+
+    vacancies = commands.add_parser("vacancies", help="Таблица вакансий")
+    vacancies.add_argument("file_name", help="csv файл с вакансиями")
+    vacancies.add_argument("--salary", type=float, help="Зарплата в рублях, попадающая в вилку")
+    vacancies.add_argument("--currency", choices=currency_to_rub)
+    vacancies.add_argument("--published-from", help="Дата ГГГГ-ММ-ДД")
+    vacancies.add_argument("--published-to", help="Дата ГГГГ-ММ-ДД")
+    vacancies.add_argument("--experience", choices=EXPERIENCE_ORDER)
+    vacancies.add_argument("--premium", action=argparse.BooleanOptionalAction)
+    vacancies.add_argument("--skill", action="append", help="Навык, можно указать несколько раз")
+    vacancies.add_argument("--area", help="Название региона")
+    vacancies.add_argument("--name", help="Часть названия вакансии")
+    vacancies.add_argument("--sort", choices=VacancyQuery.sort_keys)
+    vacancies.add_argument("--reverse", action="store_true")
+    vacancies.add_argument("--top", type=int, help="Сколько вакансий оставить после сортировки")
+    vacancies.add_argument("--range", default="", help='Диапазон строк "от до", как в интерактивном режиме')
+    vacancies.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    vacancies.add_argument("--index", action="store_true", help="Искать по индексу названий и навыков")
+    vacancies.add_argument("--rates", help="csv с курсами валют, по умолчанию фиксированные курсы")
+
+    jobs = commands.add_parser("jobs", help="Много отчётов за один запуск")
+    jobs.add_argument("jobs_file", help=f"csv со столбцами {', '.join(JOB_COLUMNS)}, "
+                                        f"обязательны file и profession")
+    jobs.add_argument("--rates", help="csv с курсами валют, по умолчанию фиксированные курсы")
+    jobs.add_argument("--write-only", action="store_true", help="Писать excel потоково")
+    jobs.add_argument("--processes", type=int)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        rates = load_rates(args.rates)
+    except (OSError, ValueError) as error:
+        parser.error(f"Не удалось прочитать курсы {args.rates}: {error}")
+    if args.command == "stats":
+        used = dict(period=args.period != "year", quantiles=args.quantiles, rates=rates is not None)
+        unsupported = [x for x, value in used.items() if value and x not in ENGINE_OPTIONS[args.engine]]
+        if unsupported:
+            parser.error(f"--engine {args.engine} не поддерживает {', '.join('--' + x for x in unsupported)}")
+        try:
+            report = profession_report(args.file_name, args.profession, args.engine, args.period, args.quantiles,
+                                       rates, args.processes)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        if not args.quiet:
+            report.print_data()
+        render_reports([report], args.image or None, args.excel, args.processes, args.write_only)
+    elif args.command == "vacancies":
+        query = VacancyQuery(args.salary, args.currency, args.published_from, args.published_to, args.experience,
+                             args.premium, args.skill, args.area, args.name, args.sort, args.reverse, args.top, rates)
+        try:
+            header, rows = query_rows(args.file_name, query, load_index(args.file_name) if args.index else None)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        if header is None:
+            print("Пустой файл")
+            return
+        offset, limit = row_range(args.range)
+        with stage("vacancies") as record:
+            record["rows"] = print_vacancies_paged(csv_filter_rows(rows, header, DISPLAY_LIMITS), replacement_dic,
+                                                   args.page_size, offset, limit)
+        if record["rows"] == 0:
+            print("Нет данных")
     else:
-        print_vacancies(dateFiltered, replacement_dic)
-
-
-
+        try:
+            jobs = read_jobs(args.jobs_file)
+            outputs = run_jobs(jobs, rates, args.processes, args.write_only)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        for job, (image, excel) in zip(jobs, outputs):
+            print(f"{job['file']}: {job['profession']} -> {', '.join(x for x in (image, excel) if x) or '-'}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main()
+        sys.exit()
 
+    choice = input("Вакансии или Статистика: ")
+    while choice not in ["Вакансии", "Статистика"]:
+        choice = input("Вакансии или Статистика: ")
 
+    if choice == "Статистика":
+        file_name = input("Введите название файла: ")
+        prof_name = input("Введите название профессии: ")
 
+        report = columnar_partial(load_columns_cached(file_name), prof_name).report()
+        report.print_data()
+        report.generate_image()
+    else:
+        rows = csv_rows(input())
+        header = next(rows, None)
+        if header is None:
+            print("Пустой файл")
+            sys.exit()
+
+        with stage("vacancies") as record:
+            rows = VacancyQuery().apply(rows, header)
+            record["rows"] = print_vacancies_paged(csv_filter_rows(rows, header, DISPLAY_LIMITS), replacement_dic)
+        if record["rows"] == 0:
+            print("Нет данных")